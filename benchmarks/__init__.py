@@ -0,0 +1,5 @@
+"""Benchmarks for glob2, comparing it to the standard library's ``glob``
+and ``pathlib``, and to ``find``, on synthetic trees.
+
+Run them with ``python -m benchmarks``; see ``--help``.
+"""
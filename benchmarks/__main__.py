@@ -0,0 +1,126 @@
+"""Command line interface of the benchmarks::
+
+    python -m benchmarks [--tree deep] [--scale 2] [--tmpfs] [--repeat 5]
+                         [--output results.json] [--compare baseline.json]
+
+Writes the results as JSON (to ``--output``), and with ``--compare``
+reports every case that got slower than in an earlier result file, and
+exits with status 1 if any did by more than ``--threshold``.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import glob2
+
+from . import cases, measure, trees
+
+
+def run(tree_names, scale, repeat, tmpfs, contenders):
+    results = []
+    base = '/dev/shm' if tmpfs and os.path.isdir('/dev/shm') else None
+    old_cwd = os.getcwd()
+    for tree in tree_names:
+        root = tempfile.mkdtemp(prefix='glob2-bench-', dir=base)
+        try:
+            trees.TREES[tree](root, scale)
+            os.chdir(root)
+            for case in cases.CASES:
+                for name, contender in cases.CONTENDERS:
+                    if contenders and name not in contenders:
+                        continue
+                    func = contender(case)
+                    if func is None:
+                        continue
+                    result = measure.measure(func, repeat,
+                                             in_process=name != 'find')
+                    result.update(tree=tree, case=case.name, contender=name)
+                    results.append(result)
+                    report(result)
+        finally:
+            os.chdir(old_cwd)
+            shutil.rmtree(root)
+    return results
+
+
+def report(result):
+    calls = result['calls']
+    calls = ' '.join('%s=%d' % item for item in sorted(calls.items())) \
+        if calls else '-'
+    memory = result['peak_memory']
+    memory = '%.1fMB' % (memory / 1e6) if memory is not None else '-'
+    print('%-9s %-7s %-25s %9.2fms %7d matches  %-8s %s' % (
+        result['tree'], result['case'], result['contender'],
+        result['wall'] * 1000, result['matches'], memory, calls))
+
+
+def compare(results, baseline_path, threshold):
+    """Print the cases which got slower than in the file at
+    ``baseline_path``; return whether any did by more than ``threshold``.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = dict(((r['tree'], r['case'], r['contender']), r)
+                  for r in baseline['results'])
+    regressed = False
+    for result in results:
+        old = before.get((result['tree'], result['case'], result['contender']))
+        if old is None or not old['wall']:
+            continue
+        ratio = result['wall'] / old['wall']
+        if ratio > 1:
+            flag = 'REGRESSION' if ratio > threshold else ''
+            print('%-9s %-7s %-25s %.2fx slower %s' % (
+                result['tree'], result['case'], result['contender'],
+                ratio, flag))
+            regressed = regressed or ratio > threshold
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--tree', action='append', choices=sorted(trees.TREES),
+                        help='tree to run on (repeatable; default: all)')
+    parser.add_argument('--contender', action='append',
+                        choices=[name for name, _ in cases.CONTENDERS],
+                        help='implementation to time (repeatable; default: all)')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='size factor for the trees')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case; the best is reported')
+    parser.add_argument('--tmpfs', action='store_true',
+                        help='create the trees in /dev/shm')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='compare against the results in this file')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown to fail --compare on (default: 1.2)')
+    args = parser.parse_args(argv)
+
+    results = run(args.tree or sorted(trees.TREES), args.scale, args.repeat,
+                  args.tmpfs, args.contender)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'glob2': '.'.join(map(str, glob2.__version__)),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'scale': args.scale,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
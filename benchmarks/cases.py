@@ -0,0 +1,80 @@
+"""What is being timed: the patterns, and how every contender runs them.
+
+Each contender is a function taking a :class:`Case` and returning a
+callable, which runs the search from within the tree and returns the
+list of matches; or None if the contender cannot express the case.
+"""
+
+from collections import namedtuple
+import glob
+import os
+import subprocess
+import sys
+
+import glob2
+
+try:
+    import pathlib
+except ImportError:
+    pathlib = None
+
+
+Case = namedtuple('Case', ['name', 'pattern', 'rglob', 'find'])
+
+CASES = [
+    # glob pattern, the pathlib.Path.rglob() equivalent, and find's.
+    Case('all', '**', '*', []),
+    Case('ext', '**/*.py', '*.py', ['-name', '*.py']),
+    Case('dirs', '**/', '*/', ['-type', 'd']),
+    Case('bytes', b'**/*.py', None, None),
+    Case('nested', '*/*/*.txt', None, ['-mindepth', '3', '-maxdepth', '3',
+                                       '-name', '*.txt']),
+]
+
+
+def glob2_glob(case):
+    return lambda: glob2.glob(case.pattern)
+
+
+def glob2_glob_matches(case):
+    return lambda: glob2.glob(case.pattern, with_matches=True)
+
+
+def glob2_iglob(case):
+    return lambda: list(glob2.iglob(case.pattern))
+
+
+def stdlib_glob(case):
+    if sys.version_info < (3, 5):
+        return None
+    return lambda: glob.glob(case.pattern, recursive=True)
+
+
+def pathlib_rglob(case):
+    if pathlib is None or case.rglob is None:
+        return None
+    if case.rglob.endswith('/') and sys.version_info < (3, 11):
+        return None
+    return lambda: list(pathlib.Path('.').rglob(case.rglob))
+
+
+def find(case):
+    if case.find is None or not _have_find():
+        return None
+    return lambda: subprocess.check_output(
+        ['find', '.', '-mindepth', '1'] + case.find).splitlines()
+
+
+def _have_find():
+    return any(os.access(os.path.join(path, 'find'), os.X_OK)
+               for path in os.environ.get('PATH', '').split(os.pathsep))
+
+
+CONTENDERS = [
+    ('glob2.glob', glob2_glob),
+    ('glob2.glob(with_matches)', glob2_glob_matches),
+    ('glob2.iglob', glob2_iglob),
+    ('glob.glob', stdlib_glob),
+    ('pathlib.rglob', pathlib_rglob),
+    ('find', find),
+]
@@ -0,0 +1,57 @@
+"""Compare the regex-free matchers of ``glob2.fnmatch`` against the
+regular expressions they stand in for, for every pattern shape that has
+a fast path::
+
+    python -m benchmarks.fnmatch_shapes [number of names]
+"""
+
+from __future__ import print_function
+
+import random
+import re
+import string
+import sys
+import timeit
+
+from glob2 import fnmatch
+
+
+SHAPES = [
+    ('literal', 'setup.py'),
+    ('*.ext', '*.py'),
+    ('prefix*', 'test_*'),
+    ('prefix*suffix', 'test_*.py'),
+    ('*', '*'),
+]
+
+
+def make_names(count, seed=0):
+    rnd = random.Random(seed)
+    names = []
+    for _ in range(count):
+        stem = ''.join(rnd.choice(string.ascii_lowercase)
+                       for _ in range(rnd.randint(3, 12)))
+        names.append(rnd.choice(['', 'test_']) + stem +
+                     rnd.choice(['.py', '.txt', '.c', '']))
+    names.append('setup.py')
+    return names
+
+
+def regex_filter(names, pat):
+    match = re.compile(fnmatch.translate(pat)).match
+    return [(name, m.groups()) for name, m in zip(names, map(match, names)) if m]
+
+
+def main(count=100000):
+    names = make_names(count)
+    print('%-15s %-12s %10s %10s %8s' % ('shape', 'pattern', 'regex', 'fast', 'speedup'))
+    for shape, pat in SHAPES:
+        assert fnmatch.filter(names, pat) == regex_filter(names, pat)
+        regex = min(timeit.repeat(lambda: regex_filter(names, pat), number=1, repeat=5))
+        fast = min(timeit.repeat(lambda: fnmatch.filter(names, pat), number=1, repeat=5))
+        print('%-15s %-12s %9.1fms %9.1fms %7.1fx' % (
+            shape, pat, regex * 1000, fast * 1000, regex / fast))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,101 @@
+"""Timing, counting filesystem calls, and measuring memory."""
+
+from contextlib import contextmanager
+import os
+import time
+
+import glob2.impl
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# The calls counted. Every scandir() stands for an opendir, some
+# getdents and a close; listdir() is not counted, since replacing it
+# would make glob2 think the filesystem is a custom one.
+COUNTED = ('scandir', 'stat', 'lstat')
+
+
+def wall_time(func, repeat):
+    """The best of ``repeat`` runs of ``func``, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = _clock()
+        func()
+        elapsed = _clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+@contextmanager
+def count_calls():
+    """Count the calls to the functions in ``COUNTED`` made within the
+    block, by whoever, into the dict yielded.
+    """
+    counts = dict((name, 0) for name in COUNTED)
+    originals = dict((name, getattr(os, name)) for name in COUNTED
+                     if hasattr(os, name))
+
+    def counting(name, func):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    # glob2 holds on to its own references to some of them, taken at
+    # import time: Globber.stat and Globber.lstat are os.stat and
+    # os.lstat as they were then.
+    impl_scandir = glob2.impl._scandir
+    globber = glob2.impl.Globber
+    methods = dict((name, globber.__dict__[name]) for name in ('stat', 'lstat'))
+    for name, func in originals.items():
+        setattr(os, name, counting(name, func))
+    if impl_scandir is not None:
+        glob2.impl._scandir = counting('scandir', impl_scandir)
+    for name, method in methods.items():
+        setattr(globber, name,
+                staticmethod(counting(name, method.__get__(None, globber))))
+    try:
+        yield counts
+    finally:
+        for name, func in originals.items():
+            setattr(os, name, func)
+        glob2.impl._scandir = impl_scandir
+        for name, method in methods.items():
+            setattr(globber, name, method)
+
+
+def peak_memory(func):
+    """The peak of the memory allocated by Python while running ``func``,
+    in bytes; None where this cannot be measured.
+    """
+    if tracemalloc is None or tracemalloc.is_tracing():
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, repeat=3, in_process=True):
+    """Run ``func`` for all measurements; the calls and memory of an
+    external program (``in_process=False``) are not known.
+    """
+    result = {'wall': wall_time(func, repeat)}
+    if in_process:
+        with count_calls() as counts:
+            result['matches'] = len(func())
+        result['calls'] = counts
+        result['peak_memory'] = peak_memory(func)
+    else:
+        result['matches'] = len(func())
+        result['calls'] = None
+        result['peak_memory'] = None
+    return result
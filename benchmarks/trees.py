@@ -0,0 +1,85 @@
+"""Synthetic directory trees to run the benchmarks on.
+
+Every tree is a function taking the directory to create it in and a
+``scale`` factor for its size; the layout is fixed for a given scale,
+so that results are comparable between runs.
+"""
+
+import os
+
+
+def _touch(path):
+    open(path, 'w').close()
+
+
+def _files(top, count, exts=('.py', '.txt', '.c')):
+    for i in range(count):
+        _touch(os.path.join(top, 'file%d%s' % (i, exts[i % len(exts)])))
+
+
+def deep(root, scale=1):
+    """A narrow tree, 2 directories wide and many levels deep."""
+    depth = 8 + scale
+
+    def make(top, level):
+        _files(top, 3)
+        if level < depth:
+            for i in range(2):
+                sub = os.path.join(top, 'd%d' % i)
+                os.mkdir(sub)
+                make(sub, level + 1)
+    make(root, 1)
+
+
+def wide(root, scale=1):
+    """A flat tree: a few directories with many files each."""
+    for i in range(4):
+        top = os.path.join(root, 'dir%d' % i)
+        os.mkdir(top)
+        _files(top, 2500 * scale)
+
+
+def hidden(root, scale=1):
+    """A tree where half of everything is hidden, including whole
+    subtrees which a plain ``**`` does not enter.
+    """
+    for i in range(20 * scale):
+        for name in ('pkg%d' % i, '.cache%d' % i):
+            top = os.path.join(root, name)
+            os.mkdir(top)
+            _files(top, 20)
+            for j in range(20):
+                _touch(os.path.join(top, '.hidden%d.py' % j))
+            sub = os.path.join(top, '.git')
+            os.mkdir(sub)
+            _files(sub, 20)
+
+
+def symlinks(root, scale=1):
+    """A tree with many links, to files and to other directories of the
+    tree (but no cycles, which not all contenders handle).
+    """
+    targets = os.path.join(root, 'targets')
+    os.mkdir(targets)
+    for i in range(10 * scale):
+        top = os.path.join(targets, 't%d' % i)
+        os.mkdir(top)
+        _files(top, 20)
+    links = os.path.join(root, 'links')
+    os.mkdir(links)
+    for i in range(10 * scale):
+        top = os.path.join(links, 'l%d' % i)
+        os.mkdir(top)
+        for j in range(20):
+            os.symlink(os.path.join(targets, 't%d' % i, 'file%d.py' % j),
+                       os.path.join(top, 'link%d.py' % j))
+        os.symlink(os.path.join(targets, 't%d' % i),
+                   os.path.join(top, 'dirlink'))
+
+
+TREES = {
+    'deep': deep,
+    'wide': wide,
+    'hidden': hidden,
+    'symlinks': symlinks,
+}
@@ -1,5 +1,15 @@
 from __future__ import absolute_import
+import sys
 from .impl import *
+from .archive import ZipGlobber, TarGlobber
+from .cache import CachingGlobber
+from .index import PersistentIndexGlobber
+from .indexed import IndexedGlobber
+from .parallel import ParallelGlobber, ShardedGlobber
+from .stats import InstrumentedGlobber, GlobStats
+from .watch import GlobWatcher, GlobEvent, watch
+if sys.version_info >= (3, 6):
+    from .aio import AsyncGlobber, aiglob
 
 
 __version__ = (0, 7)
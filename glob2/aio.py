@@ -0,0 +1,246 @@
+"""Globbing for asyncio; requires Python 3.6 or later."""
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import os
+
+from .impl import (Globber, _Criteria, _Frontier, _ListdirEntry,
+                   _Program, _scandir, _unique, has_magic)
+
+
+__all__ = ('AsyncGlobber', 'aiglob')
+
+
+class AsyncGlobber(Globber):
+    """A globber for use with asyncio.
+
+    ``listdir``, ``exists``, ``isdir``, ``islink``, ``stat`` (and,
+    optionally, ``scandir``) are coroutines here; to glob a storage which is accessed
+    asynchronously, derive from this class and override them like you
+    would for a custom :class:`Globber`. Those not overridden run the
+    local filesystem calls on the event loop's default executor, or on
+    ``executor``.
+
+    Up to ``concurrency`` directories are read at the same time. Matches
+    are yielded as soon as their directory has been read.
+    """
+
+    _blocking_stat = False
+
+    def __init__(self, concurrency=16, executor=None):
+        self.concurrency = concurrency
+        self.executor = executor
+
+    async def listdir(self, path):
+        return await self._run(os.listdir, path)
+
+    async def exists(self, path):
+        return await self._run(os.path.lexists, path)
+
+    async def isdir(self, path):
+        return await self._run(os.path.isdir, path)
+
+    async def islink(self, path):
+        return await self._run(os.path.islink, path)
+
+    async def scandir(self, path):
+        if self._native_fs():
+            return await self._run(_list_scandir, path)
+        return [_ListdirEntry(self, path, name)
+                for name in await self.listdir(path)]
+
+    async def stat(self, path):
+        return await self._run(os.stat, path)
+
+    async def lstat(self, path):
+        return await self._run(os.lstat, path)
+
+    async def read_ignore_file(self, path):
+        return await self._run(Globber.read_ignore_file, self, path)
+
+    def _native_fs(self):
+        cls = type(self)
+        return (_scandir is not None and
+                cls.listdir is AsyncGlobber.listdir and
+                cls.isdir is AsyncGlobber.isdir and
+                cls.islink is AsyncGlobber.islink)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def glob(self, pathname, with_matches=False, include_hidden=False,
+                   recursive=True, norm_paths=True, case_sensitive=True,
+                   sep=None, exclude=None, gitignore=False, limit=None,
+                   min_depth=None, max_depth=None, with_stat=False,
+                   type=None, min_size=None, max_size=None, newer_than=None,
+                   older_than=None, predicate=None, sort=False,
+                   followlinks=False, one_filesystem=False):
+        """Return a list of paths matching a pathname pattern; see
+        :meth:`Globber.glob`.
+        """
+        return [result async for result in self.aiglob(
+            pathname, with_matches, include_hidden, recursive, norm_paths,
+            case_sensitive, sep, exclude, gitignore, limit, min_depth,
+            max_depth, with_stat, type, min_size, max_size, newer_than,
+            older_than, predicate, sort, followlinks, one_filesystem)]
+
+    async def aiglob(self, pathname, with_matches=False, include_hidden=False,
+                     recursive=True, norm_paths=True, case_sensitive=True,
+                     sep=None, exclude=None, gitignore=False, limit=None,
+                     min_depth=None, max_depth=None, with_stat=False,
+                     type=None, min_size=None, max_size=None,
+                     newer_than=None, older_than=None, predicate=None,
+                     sort=False, followlinks=False, one_filesystem=False):
+        """Asynchronously yield the paths matching a pathname pattern; see
+        :meth:`Globber.iglob`.
+        """
+        if limit == 0:
+            return
+        criteria = _Criteria.from_options(type, min_size, max_size,
+                                          newer_than, older_than, predicate)
+        if (not has_magic(pathname) and criteria is None and
+                not exclude and not gitignore):
+            if ((not min_depth or min_depth <= 1) and
+                    (max_depth is None or max_depth >= 1) and
+                    await self.exists(pathname)):
+                if with_stat:
+                    yield await self._astat_result(pathname, (), None)
+                else:
+                    yield (pathname, ()) if with_matches else pathname
+            return
+
+        program = _Program([pathname], include_hidden, norm_paths,
+                           case_sensitive, sep, exclude, gitignore,
+                           min_depth, max_depth, criteria, sort, followlinks,
+                           one_filesystem)
+        steps = self._aiter_steps(program)
+        count = 0
+        try:
+            async for results in steps:
+                if program.expanded:
+                    results = _unique(results)
+                for path, _, groups, entry in results:
+                    if with_stat:
+                        yield await self._astat_result(path, groups, entry)
+                    else:
+                        yield (path, groups) if with_matches else path
+                    count += 1
+                    if count == limit:
+                        return
+        finally:
+            await steps.aclose()
+
+    def iglob(self, *args, **kwargs):
+        raise TypeError('AsyncGlobber needs to be used through aiglob()')
+
+    def _step(self, program, node):
+        raise TypeError('AsyncGlobber needs to be used through aiglob()')
+
+    async def _astep(self, program, node):
+        """Like :meth:`Globber._step`, but awaiting the filesystem calls."""
+        return await self._arun_requests(self._resolve(program, node))
+
+    async def _astat_result(self, path, groups, entry):
+        """The :class:`GlobResult` for a match, its type and stat fetched
+        through the (asynchronous) filesystem methods already.
+        """
+        return await self._arun_requests(
+            self._fetch_result(path, groups, entry))
+
+    async def _arun_requests(self, resolve):
+        """Make the filesystem calls generator ``resolve`` asks for,
+        awaiting them, and return its final answer.
+        """
+        request = next(resolve)
+        while request[0] is not None:
+            method, path = request
+            try:
+                reply = getattr(self, method)(path)
+                if inspect.isawaitable(reply):
+                    reply = await reply
+            except (IOError, OSError) as err:
+                request = resolve.throw(err)
+            else:
+                request = resolve.send(reply)
+        return request[1]
+
+    async def _aiter_steps(self, program):
+        if program.sort:
+            async for results in self._asorted_steps(program):
+                yield results
+            return
+        stack = list(reversed(program.roots))
+        tasks = set()
+        try:
+            while stack or tasks:
+                while stack and len(tasks) < self.concurrency:
+                    tasks.add(asyncio.ensure_future(
+                        self._astep(program, stack.pop())))
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results, children = task.result()
+                    stack.extend(reversed(children))
+                    if results:
+                        yield results
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _asorted_steps(self, program):
+        """Like the sorted search of :meth:`Globber._iter_steps`, but
+        start reading the first few directories still to be searched (in
+        that order) ahead of time.
+        """
+        frontier = _Frontier(program)
+        count = itertools.count()
+        unread = [(frontier.key(node), next(count), node) for node in program.roots]
+        heapq.heapify(unread)
+        # Nodes being read ahead, and (mapping to None) those read
+        # without, which are still on the unread heap.
+        started = {}
+        tasks = set()
+        try:
+            while True:
+                while unread and len(tasks) < self.concurrency:
+                    node = heapq.heappop(unread)[2]
+                    if node in started:
+                        del started[node]
+                        continue
+                    started[node] = asyncio.ensure_future(self._astep(program, node))
+                    tasks.add(started[node])
+                results, node = frontier.pop()
+                if results:
+                    yield results
+                if node is None:
+                    return
+                task = started.pop(node, None)
+                if task is None:
+                    task = asyncio.ensure_future(self._astep(program, node))
+                    tasks.add(task)
+                    started[node] = None
+                results, children = await task
+                tasks.discard(task)
+                frontier.add(results, children)
+                for child in children:
+                    heapq.heappush(unread, (frontier.key(child), next(count), child))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _list_scandir(path):
+    return list(_scandir(path))
+
+
+_default_globber = AsyncGlobber()
+
+
+def aiglob(pathname, *args, **kwargs):
+    """Asynchronously yield the paths matching a pathname pattern, see
+    :meth:`AsyncGlobber.aiglob`.
+    """
+    return _default_globber.aiglob(pathname, *args, **kwargs)
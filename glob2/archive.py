@@ -0,0 +1,126 @@
+"""Globbers over the members of zip and tar archives."""
+
+from __future__ import absolute_import
+
+import errno
+import os
+import stat
+import tarfile
+import time
+import zipfile
+
+from .indexed import IndexedGlobber
+
+
+__all__ = ('ZipGlobber', 'TarGlobber')
+
+
+class _ArchiveGlobber(IndexedGlobber):
+    """An :class:`IndexedGlobber` over the members of an archive, which
+    knows their sizes, times and modes, and can open them.
+    """
+
+    def __init__(self, archive, members, owned):
+        self.archive = archive
+        self._owned = owned
+        members = list(members)
+        IndexedGlobber.__init__(self, [name for name, _ in members])
+        self._members = dict((self._key(name), member)
+                             for name, member in members)
+
+    def stat(self, path):
+        key = self._key(path)
+        member = self._members.get(key)
+        if member is None:
+            if not self.isdir(path):
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            # A directory which is only there through the paths below it.
+            return os.stat_result((stat.S_IFDIR | 0o755, 0, 0, 1, 0, 0, 0, 0, 0, 0))
+        mode, size, mtime = self._describe(member)
+        if stat.S_IFMT(mode) == 0:
+            mode |= stat.S_IFDIR if self.isdir(path) else stat.S_IFREG
+        return os.stat_result((mode, 0, 0, 1, 0, 0, size, mtime, mtime, mtime))
+
+    def open(self, path):
+        """Return a file object reading the member at ``path``, without
+        extracting it.
+        """
+        member = self._members.get(self._key(path))
+        if member is None or self.isdir(path):
+            raise IOError(errno.ENOENT, 'No file in the archive', path)
+        return self._open(member)
+
+    def close(self):
+        """Close the archive, if the globber opened it."""
+        if self._owned:
+            self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ZipGlobber(_ArchiveGlobber):
+    """Globs over the members of zip archive ``file`` (a path, a file
+    object, or a ``zipfile.ZipFile``), without extracting anything.
+
+    The members are indexed from the central directory of the archive,
+    which is all that is read of it; :meth:`open` streams a member.
+    """
+
+    def __init__(self, file):
+        owned = not isinstance(file, zipfile.ZipFile)
+        archive = zipfile.ZipFile(file) if owned else file
+        _ArchiveGlobber.__init__(
+            self, archive, ((info.filename, info) for info in archive.infolist()),
+            owned)
+
+    def _describe(self, info):
+        mode = info.external_attr >> 16
+        if info.filename.endswith('/'):
+            mode = stat.S_IFDIR | (stat.S_IMODE(mode) or 0o755)
+        mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+        return mode, info.file_size, mtime
+
+    def _open(self, info):
+        return self.archive.open(info)
+
+
+class TarGlobber(_ArchiveGlobber):
+    """Globs over the members of tar archive ``file`` (a path, a file
+    object, or a ``tarfile.TarFile``), compressed or not, without
+    extracting anything.
+
+    The members are indexed in a single pass over the headers of the
+    archive (which, if it is compressed, does mean decompressing it);
+    :meth:`open` streams a member. Links are listed as files.
+    """
+
+    def __init__(self, file):
+        owned = not isinstance(file, tarfile.TarFile)
+        if not owned:
+            archive = file
+        elif isinstance(file, (str, bytes, type(u''))):
+            archive = tarfile.open(file)
+        else:
+            archive = tarfile.open(fileobj=file)
+        _ArchiveGlobber.__init__(
+            self, archive,
+            ((member.name + '/' if member.isdir() else member.name, member)
+             for member in archive.getmembers()),
+            owned)
+
+    def _describe(self, member):
+        mode = stat.S_IMODE(member.mode)
+        if member.isdir():
+            mode |= stat.S_IFDIR
+        elif member.issym():
+            mode |= stat.S_IFLNK
+        else:
+            mode |= stat.S_IFREG
+        return mode, member.size, int(member.mtime)
+
+    def _open(self, member):
+        return self.archive.extractfile(member)
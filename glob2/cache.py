@@ -0,0 +1,220 @@
+"""A globber which remembers what it has seen of the filesystem."""
+
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+from collections import namedtuple, OrderedDict
+from threading import RLock
+
+from .impl import Globber, _StaticEntry
+
+
+__all__ = ('CachingGlobber',)
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize",
+                                     "currsize", "maxbytes", "currbytes"])
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# Listings are validated against the directory's own mtime, the other
+# answers against the mtime of the directory containing the path.
+_LISTINGS = ('scandir', 'listdir')
+
+
+class CachingGlobber(Globber):
+    """Caches the results of ``scandir``, ``listdir``, ``exists``,
+    ``isdir`` and ``islink`` across calls, so that globbing the same
+    trees over and over again does not hit the filesystem every time.
+
+    To cache a custom globber, derive from both, this class first::
+
+        class CachingStorageGlobber(CachingGlobber, VirtualStorageGlobber):
+            pass
+
+        globber = CachingStorageGlobber(storage=sftp_storage, ttl=5)
+
+    Keyword arguments other than those below, like ``storage`` here, are
+    passed on to the other classes.
+
+    ``maxsize`` limits the number of answers kept, ``maxbytes`` the
+    (estimated) memory they take up; the least recently used ones are
+    evicted first. Either may be ``None`` for no limit. Answers older
+    than ``ttl`` seconds are not used anymore. With ``revalidate``, every
+    answer is checked against the mtime of the directory it depends on
+    (which costs a ``stat`` call, but a lot less than a listing does).
+
+    Errors raised by ``listdir``/``scandir`` are cached as well, so
+    that a directory which is not there is not asked for again either.
+    """
+
+    _wraps_fs = True
+
+    def __init__(self, maxsize=10000, maxbytes=None, ttl=None, revalidate=False,
+                 **kwargs):
+        super(CachingGlobber, self).__init__(**kwargs)
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self._cache = OrderedDict()
+        self._lock = RLock()
+        self._bytes = 0
+        self._stats = [0, 0, 0]     # hits, misses, evictions
+
+    def scandir(self, path):
+        return self._cached('scandir', path, super(CachingGlobber, self).scandir)
+
+    def listdir(self, path):
+        return list(self._cached('listdir', path,
+                                 super(CachingGlobber, self).listdir))
+
+    def exists(self, path):
+        return self._cached('exists', path, super(CachingGlobber, self).exists)
+
+    def isdir(self, path):
+        return self._cached('isdir', path, super(CachingGlobber, self).isdir)
+
+    def islink(self, path):
+        return self._cached('islink', path, super(CachingGlobber, self).islink)
+
+    def getmtime(self, path):
+        """Used to ``revalidate`` cached answers; override this along with
+        the other filesystem methods for a custom storage.
+        """
+        return os.stat(path).st_mtime
+
+    def invalidate(self, path, recursive=False):
+        """Forget everything cached about ``path``, and also about
+        everything below it if ``recursive`` is set.
+
+        The listing of the directory containing ``path`` is dropped as
+        well, since it is probably out of date too. Paths are compared
+        as absolute, normalized ones, however they were spelled.
+        """
+        path = os.path.abspath(path)
+        parent = os.path.dirname(path)
+        prefix = os.path.join(path, path[:0])
+        as_bytes = isinstance(path, bytes)
+        with self._lock:
+            for key in list(self._cache):
+                kind, cached = key
+                if isinstance(cached, bytes) != as_bytes:
+                    continue
+                cached = os.path.abspath(cached)
+                if (cached == path or
+                        recursive and cached.startswith(prefix) or
+                        kind in _LISTINGS and cached == parent):
+                    self._remove(key)
+
+    def cache_info(self):
+        """Report cache statistics."""
+        with self._lock:
+            return CacheInfo(self._stats[0], self._stats[1], self._stats[2],
+                             self.maxsize, len(self._cache),
+                             self.maxbytes, self._bytes)
+
+    def cache_clear(self):
+        """Clear the cache and cache statistics."""
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+            self._stats[:] = [0, 0, 0]
+
+    def _cached(self, kind, path, func):
+        key = (kind, path)
+        with self._lock:
+            item = self._cache.pop(key, None)
+            if item is not None and self._valid(kind, path, item):
+                # Re-insert to mark as most recently used.
+                self._cache[key] = item
+                self._stats[0] += 1
+                return self._unpack(item[0])
+            if item is not None:
+                self._bytes -= item[3]
+
+        mtime = self._mtime(kind, path) if self.revalidate else None
+        try:
+            value = func(path)
+            if kind == 'scandir':
+                value = [_static(path, entry) for entry in value]
+        except os.error:
+            value = _Error(sys.exc_info()[1])
+
+        item = (value, _clock(), mtime, _sizeof(value))
+        with self._lock:
+            self._stats[1] += 1
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._cache[key] = item
+            self._bytes += item[3]
+            self._evict()
+        return self._unpack(value)
+
+    def _valid(self, kind, path, item):
+        value, created, mtime, size = item
+        if self.ttl is not None and _clock() - created > self.ttl:
+            return False
+        if self.revalidate and self._mtime(kind, path) != mtime:
+            return False
+        return True
+
+    def _mtime(self, kind, path):
+        if kind not in _LISTINGS:
+            path = os.path.dirname(path) or os.curdir
+        try:
+            return self.getmtime(path)
+        except os.error:
+            return None
+
+    def _evict(self):
+        while self._cache and (
+                self.maxsize is not None and len(self._cache) > self.maxsize or
+                self.maxbytes is not None and self._bytes > self.maxbytes):
+            key = next(iter(self._cache))
+            self._remove(key)
+            self._stats[2] += 1
+
+    def _remove(self, key):
+        item = self._cache.pop(key)
+        self._bytes -= item[3]
+
+    @staticmethod
+    def _unpack(value):
+        if value.__class__ is _Error:
+            raise value.error
+        return value
+
+
+def _static(path, entry):
+    """Only keep the name and type of an ``os.DirEntry``: the stat it
+    remembers would be out of date long before the listing is.
+    """
+    if not hasattr(entry, 'stat'):
+        return entry
+    return _StaticEntry(path, entry.name, entry.is_dir(), entry.is_symlink())
+
+
+class _Error(object):
+    """A cached exception."""
+
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _sizeof(value):
+    """Rough estimate of the memory taken up by a cached answer."""
+    size = sys.getsizeof(value)
+    if isinstance(value, list):
+        for item in value:
+            if hasattr(item, 'name'):
+                # A DirEntry is about 100 bytes, plus its name and path.
+                size += 100 + 2 * sys.getsizeof(item.name)
+            else:
+                size += sys.getsizeof(item)
+    return size
@@ -9,6 +9,8 @@ expression.  They cache the compiled regular expressions for speed.
 The function translate(PATTERN) returns a regular expression
 corresponding to PATTERN.  (It does not compile it.)
 """
+from itertools import compress, repeat
+from operator import eq
 import os
 import re
 try:
@@ -27,6 +29,39 @@ def _norm_paths(path, norm_paths, sep):
     return path
 
 
+def _normalizer(norm_paths, sep):
+    """Return the function :func:`_norm_paths` amounts to for these
+    options, or None where it would never change a thing.
+    """
+    if norm_paths is None:
+        if (sep or os.sep) == '/':
+            return None
+    elif not norm_paths or os.path.normcase('A/') == 'A/':
+        return None
+    return _Normalizer(norm_paths, sep)
+
+
+class _Normalizer(object):
+    """:func:`_norm_paths` for given options; unlike a closure, this can
+    be pickled, to send a compiled pattern to another process.
+    """
+
+    __slots__ = ('norm_paths', 'sep')
+
+    def __init__(self, norm_paths, sep):
+        self.norm_paths = norm_paths
+        self.sep = sep
+
+    def __call__(self, path):
+        return _norm_paths(path, self.norm_paths, self.sep)
+
+    def __getstate__(self):
+        return self.norm_paths, self.sep
+
+    def __setstate__(self, state):
+        self.norm_paths, self.sep = state
+
+
 def fnmatch(name, pat, norm_paths=True, case_sensitive=True, sep=None):
     """Test whether FILENAME matches PATTERN.
 
@@ -68,8 +103,9 @@ def fnmatch(name, pat, norm_paths=True, case_sensitive=True, sep=None):
     return fnmatchcase(name, pat, case_sensitive=case_sensitive)
 
 
-@lru_cache(maxsize=256, typed=True)
-def _compile_pattern(pat, case_sensitive):
+def _compile(pat, case_sensitive):
+    if case_sensitive and _shape(pat) == (pat, None):
+        return _LiteralMatcher(pat)
     if isinstance(pat, bytes):
         pat_str = pat.decode('ISO-8859-1')
         res_str = translate(pat_str)
@@ -80,17 +116,153 @@ def _compile_pattern(pat, case_sensitive):
     return re.compile(res, flags).match
 
 
+def _shape(pat):
+    """Recognize the most common shapes of patterns, which can be matched
+    without a regex: return ``(pat, None)`` for a literal name, and
+    ``(prefix, suffix)`` for ``prefix*suffix`` (either of which may be
+    empty). Return None for any other pattern.
+    """
+    if isinstance(pat, bytes):
+        star, question, bracket, brace = b'*', b'?', b'[', b'{'
+    else:
+        star, question, bracket, brace = '*', '?', '[', '{'
+    if question in pat or bracket in pat or brace in pat and _has_braces(pat):
+        return None
+    count = pat.count(star)
+    if count == 0:
+        return pat, None
+    if count == 1:
+        return tuple(pat.split(star))
+    return None
+
+
+_compile_pattern = lru_cache(maxsize=256, typed=True)(_compile)
+_simple_shape = lru_cache(maxsize=256, typed=True)(_shape)
+
+
+class _Match(object):
+    """Stands in for a regex match object."""
+
+    __slots__ = ('_groups',)
+
+    def __init__(self, groups):
+        self._groups = groups
+
+    def groups(self):
+        return self._groups
+
+
+_NO_GROUPS = _Match(())
+
+
+class _LiteralMatcher(object):
+    """Matches a literal name, like a regex ``match`` would."""
+
+    __slots__ = ('pat',)
+
+    def __init__(self, pat):
+        self.pat = pat
+
+    def __call__(self, name):
+        return _NO_GROUPS if name == self.pat else None
+
+    def __getstate__(self):
+        return self.pat
+
+    def __setstate__(self, state):
+        self.pat = state
+
+
+
+def _filter_simple(names, normalized, prefix, suffix):
+    """:func:`filter` for the patterns which :func:`_simple_shape`
+    recognizes. Where the names are not normalized, they are tested by
+    ``startswith``, ``endswith`` or ``==`` mapped over the whole list,
+    and only the hits are looked at one by one, to extract the match of
+    the ``*``.
+    """
+    if suffix is None:
+        return [(name, ()) for name in
+                compress(names, map(eq, normalized, repeat(prefix)))]
+
+    start, end = len(prefix), len(suffix)
+    if normalized is not names:
+        return [(name, (n[start:len(n) - end],))
+                for name, n in zip(names, normalized)
+                if len(n) >= start + end and
+                n.startswith(prefix) and n.endswith(suffix)]
+
+    kind = type(prefix)
+    hits = names
+    if prefix:
+        hits = compress(hits, map(kind.startswith, names, repeat(prefix)))
+    if suffix:
+        if prefix:
+            hits = list(hits)
+        hits = compress(hits, map(kind.endswith, hits, repeat(suffix)))
+    if prefix and suffix:
+        # The prefix and suffix must not overlap.
+        return [(n, (n[start:-end],)) for n in hits if len(n) >= start + end]
+    return [(n, (n[start:len(n) - end],)) for n in hits]
+
+
 def filter(names, pat, norm_paths=True, case_sensitive=True, sep=None):
-    """Return the subset of the list NAMES that match PAT."""
-    result = []
-    pat = _norm_paths(pat, norm_paths, sep)
-    match = _compile_pattern(pat, case_sensitive)
-    for name in names:
-        m = match(_norm_paths(name, norm_paths, sep))
-        if m:
-            result.append((name,
-                           tuple(_norm_paths(p, norm_paths, sep) for p in m.groups())))
-    return result
+    """Return the subset of the list NAMES that match PAT, as
+    ``(name, groups)`` pairs.
+
+    Where the names need normalizing at all, they are normalized in one
+    go, rather than one by one.
+    """
+    normalize = _normalizer(norm_paths, sep)
+    if normalize is not None:
+        pat = normalize(pat)
+    shape = _simple_shape(pat) if case_sensitive else None
+    match = None if shape is not None else _compile_pattern(pat, case_sensitive)
+    return _filter(names, normalize, shape, match)
+
+
+class _CompiledFilter(object):
+    """Does what :func:`filter` does for PAT, for any list of names.
+    The pattern is compiled right away, without going through (or
+    taking up room in) the cache :func:`filter` uses. Compiled filters
+    can be pickled, to be sent to other processes.
+    """
+
+    __slots__ = ('normalize', 'shape', 'match')
+
+    def __init__(self, pat, norm_paths=True, case_sensitive=True, sep=None):
+        self.normalize = _normalizer(norm_paths, sep)
+        if self.normalize is not None:
+            pat = self.normalize(pat)
+        self.shape = _shape(pat) if case_sensitive else None
+        self.match = (None if self.shape is not None
+                      else _compile(pat, case_sensitive))
+
+    def __call__(self, names):
+        return _filter(names, self.normalize, self.shape, self.match)
+
+    def __getstate__(self):
+        return self.normalize, self.shape, self.match
+
+    def __setstate__(self, state):
+        self.normalize, self.shape, self.match = state
+
+
+def _filter(names, normalize, shape, match):
+    names = list(names)
+    normalized = names
+    if normalize is not None and names:
+        nul = b'\0' if isinstance(names[0], bytes) else '\0'
+        normalized = normalize(nul.join(names)).split(nul)
+        if len(normalized) != len(names):
+            # Some of the names contain NULs themselves.
+            normalized = [normalize(name) for name in names]
+    # The groups are parts of the normalized name, so there is no need
+    # to normalize them once more.
+    if shape is not None:
+        return _filter_simple(names, normalized, *shape)
+    return [(name, m.groups())
+            for name, m in zip(names, map(match, normalized)) if m]
 
 
 def fnmatchcase(name, pat, case_sensitive=True):
@@ -107,26 +279,32 @@ def translate(pat):
     """Translate a shell PATTERN to a regular expression.
 
     There is no way to quote meta-characters.
+
+    Alternatives in braces, like ``{a,b}``, become an alternation which
+    is captured as a group of its own (the wildcards within it are not
+    captured separately); a brace without a comma is just a brace.
     """
+    return '(?ms)' + _translate(pat) + r'\Z'
+
 
+def _translate(pat, capture=True, slash=None):
+    # Within alternatives, wildcards are not captured: the groups of
+    # those not taken would be None. With ``slash``, the pattern is one
+    # segment of a whole path, and no wildcard matches a ``slash``.
+    group = '(%s)' if capture else '%s'
+    any_char = '.' if slash is None else '[^%s]' % re.escape(slash)
     i, n = 0, len(pat)
     res = ''
     while i < n:
         c = pat[i]
         i = i+1
         if c == '*':
-            res = res + '(.*)'
+            res = res + group % (any_char + '*')
         elif c == '?':
-            res = res + '(.)'
+            res = res + group % any_char
         elif c == '[':
-            j = i
-            if j < n and pat[j] == '!':
-                j = j+1
-            if j < n and pat[j] == ']':
-                j = j+1
-            while j < n and pat[j] != ']':
-                j = j+1
-            if j >= n:
+            j = _bracket_end(pat, i - 1)
+            if j < 0:
                 res = res + '\\['
             else:
                 stuff = pat[i:j].replace('\\','\\\\')
@@ -135,7 +313,95 @@ def translate(pat):
                     stuff = '^' + stuff[1:]
                 elif stuff[0] == '^':
                     stuff = '\\' + stuff
-                res = '%s([%s])' % (res, stuff)
+                stuff = '[%s]' % stuff
+                if slash is not None:
+                    stuff = '(?!%s)%s' % (re.escape(slash), stuff)
+                res = res + group % stuff
+        elif c == '{' and _brace_bounds(pat, i - 1):
+            bounds = _brace_bounds(pat, i - 1)
+            res = res + ('(%s)' if capture else '(?:%s)') % '|'.join(
+                _translate(pat[a + 1:b], False, slash)
+                for a, b in zip(bounds, bounds[1:]))
+            i = bounds[-1] + 1
         else:
             res = res + re.escape(c)
-    return '(?ms)' + res + '\Z'
+    return res
+
+
+def _bracket_end(pat, i):
+    """The index of the ``]`` closing the ``[`` at ``pat[i]``, or -1."""
+    n = len(pat)
+    j = i + 1
+    if j < n and pat[j] == '!':
+        j = j+1
+    if j < n and pat[j] == ']':
+        j = j+1
+    while j < n and pat[j] != ']':
+        j = j+1
+    return j if j < n else -1
+
+
+def _brace_bounds(pat, i):
+    """If the ``{`` at ``pat[i]`` opens a list of alternatives, return
+    the indexes of the opening brace, the commas between them, and the
+    closing brace; otherwise, None.
+    """
+    bounds = [i]
+    depth = 0
+    j = i + 1
+    while j < len(pat):
+        c = pat[j]
+        if c == '[':
+            end = _bracket_end(pat, j)
+            if end >= 0:
+                j = end
+        elif c == '{':
+            depth += 1
+        elif c == '}':
+            if depth == 0:
+                return bounds + [j] if len(bounds) > 1 else None
+            depth -= 1
+        elif c == ',' and depth == 0:
+            bounds.append(j)
+        j += 1
+    return None
+
+
+def _has_braces(pat):
+    """Whether PAT contains any alternatives in braces."""
+    if isinstance(pat, bytes):
+        pat = pat.decode('ISO-8859-1')
+    i = pat.find('{')
+    while i >= 0:
+        if _brace_bounds(pat, i):
+            return True
+        i = pat.find('{', i + 1)
+    return False
+
+
+def _expand_braces(pat, only_containing=None):
+    """Expand the alternatives in braces into the list of patterns PAT
+    stands for, in order: ``a{b,c}d`` becomes ``['abd', 'acd']``. With
+    ``only_containing``, only braces which contain any of these
+    characters are expanded.
+    """
+    if isinstance(pat, bytes):
+        return [p.encode('ISO-8859-1') for p in
+                _expand_braces(pat.decode('ISO-8859-1'), only_containing)]
+    i = 0
+    while i < len(pat):
+        if pat[i] == '[':
+            end = _bracket_end(pat, i)
+            if end >= 0:
+                i = end
+        elif pat[i] == '{':
+            bounds = _brace_bounds(pat, i)
+            if bounds and (not only_containing or any(
+                    c in pat[i:bounds[-1]] for c in only_containing)):
+                tails = _expand_braces(pat[bounds[-1] + 1:], only_containing)
+                return [pat[:i] + alt + tail
+                        for a, b in zip(bounds, bounds[1:])
+                        for alt in _expand_braces(pat[a + 1:b], only_containing)
+                        for tail in tails]
+        i += 1
+    return [pat]
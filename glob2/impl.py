@@ -2,9 +2,14 @@
 
 from __future__ import absolute_import
 
-import sys
+import copy
+from heapq import heappop, heappush
+import io
+import itertools
 import os
 import re
+import stat
+import sys
 from os.path import join
 from . import fnmatch
 
@@ -13,6 +18,14 @@ try:
 except ImportError:
     imap = map
 
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
 
 class Globber(object):
 
@@ -20,33 +33,127 @@ class Globber(object):
     isdir = staticmethod(os.path.isdir)
     islink = staticmethod(os.path.islink)
     exists = staticmethod(os.path.lexists)
+    stat = staticmethod(os.stat)
+    lstat = staticmethod(os.lstat)
+
+    # Whether stat() can be called right away, which GlobResult does;
+    # not so where the filesystem methods are coroutines.
+    _blocking_stat = True
 
-    def walk(self, top, followlinks=False, sep=None):
-        """A simplified version of os.walk (code copied) that uses
-        ``self.listdir``, and the other local filesystem methods.
+    def scandir(self, path):
+        """Return the entries of directory ``path`` as ``os.DirEntry``-like
+        objects, providing ``name``, ``path``, ``is_dir()`` and
+        ``is_symlink()``.
+
+        On the local filesystem this is ``os.scandir``, which gets the
+        file types for free from the directory listing itself. If
+        ``listdir``, ``isdir`` or ``islink`` have been replaced, the
+        entries are built from ``self.listdir`` instead, and their type
+        is only looked up (through ``self.isdir``/``self.islink``) if
+        somebody asks.
+        """
+        if self._native_fs():
+            return list(_scandir(path))
+        return [_ListdirEntry(self, path, name) for name in self.listdir(path)]
+
+    # Set on classes which merely wrap the filesystem methods of the
+    # classes after them (to cache or to instrument them): to decide
+    # whether the filesystem is the local one, scandir() looks past them.
+    _wraps_fs = False
+
+    def _native_fs(self):
+        if _scandir is None:
+            return False
+        native = _native_classes.get(type(self))
+        if native is None:
+            native = _native_classes[type(self)] = _is_native(type(self))
+        instance = getattr(self, '__dict__', None)
+        return native and not (instance and any(
+            name in instance for name in _FS_METHODS))
+
+    def _may_descend(self, entry, followlinks):
+        """Whether ``entry`` should be treated as a directory to read
+        from, without spending a syscall on it if at all possible.
+        """
+        if entry.__class__ is _ListdirEntry:
+            # Type unknown; as always, let listdir() find out whether this
+            # is a directory, and use islink() only to avoid the links.
+            return followlinks or not entry.is_symlink()
+        return entry.is_dir(follow_symlinks=followlinks)
+
+    def walk(self, top, followlinks=False, sep=None, max_depth=None,
+             one_filesystem=False):
+        """A simplified version of os.walk that uses ``self.scandir``,
+        and the other local filesystem methods.
 
         Because we don't care about file/directory distinctions, only
         a single list is returned.
+
+        ``max_depth`` limits how many levels of directories below ``top``
+        are entered; with 0, only ``top`` itself is listed. With
+        ``followlinks``, a link back to a directory the walk is already
+        in is not followed, so that loops of links end; directories are
+        told apart by their device and inode numbers (``self.stat``).
+        With ``one_filesystem``, directories on another filesystem than
+        ``top`` are not entered.
         """
-        try:
-            names = self.listdir(top)
-        except os.error as err:
-            return
+        for top, entries in self._walk_entries(top, followlinks, sep, max_depth,
+                                               one_filesystem):
+            yield top, [entry.name for entry in entries]
+
+    def _walk_entries(self, top, followlinks, sep, max_depth=None,
+                      one_filesystem=False):
+        # An explicit stack of (path, levels left, identity, identities
+        # of the directories it is in), rather than recursion, so that a
+        # deep tree neither hits the recursion limit, nor makes every
+        # entry pass through a chain of generators.
+        track = followlinks or one_filesystem
+        root = self._identity(top) if track else None
+        stack = [(top, max_depth, root, None)]
+        while stack:
+            path, levels, ident, ancestors = stack.pop()
+            try:
+                entries = self.scandir(path)
+            except os.error:
+                continue
 
-        items = []
-        for name in names:
-            items.append(name)
+            yield path, entries
 
-        yield top, items
+            if levels is not None:
+                if levels <= 0:
+                    continue
+                levels -= 1
+            if followlinks and ident is not None:
+                ancestors = (ident, ancestors)
+            children = []
+            for entry in entries:
+                if not self._may_descend(entry, followlinks):
+                    continue
+                new_path = _join_paths([path, entry.name], sep=sep)
+                child = self._identity(new_path, entry) if track else None
+                if child is not None and (
+                        one_filesystem and root is not None and child[0] != root[0] or
+                        followlinks and entry.is_symlink() and _in_chain(child, ancestors)):
+                    continue
+                children.append((new_path, levels, child, ancestors))
+            stack.extend(reversed(children))
 
-        for name in items:
-            new_path = _join_paths([top, name], sep=sep)
-            if followlinks or not self.islink(new_path):
-                for x in self.walk(new_path, followlinks):
-                    yield x
+    def _identity(self, path, entry=None):
+        """``(st_dev, st_ino)`` of directory ``path``, or None if unknown."""
+        try:
+            st = _entry_stat(entry)
+            if st is None:
+                st = self.stat(path)
+        except os.error:
+            return None
+        return st.st_dev, st.st_ino
 
     def glob(self, pathname, with_matches=False, include_hidden=False, recursive=True,
-             norm_paths=True, case_sensitive=True, sep=None):
+             norm_paths=True, case_sensitive=True, sep=None, exclude=None,
+             gitignore=False, limit=None, min_depth=None, max_depth=None,
+             with_stat=False, type=None, min_size=None, max_size=None,
+             newer_than=None, older_than=None, predicate=None, sort=False,
+             followlinks=False, one_filesystem=False):
         """Return a list of paths matching a pathname pattern.
 
         The pattern may contain simple shell-style wildcards a la
@@ -58,10 +165,23 @@ class Globber(object):
         a dot are also returned.
         """
         return list(self.iglob(pathname, with_matches, include_hidden,
-                               norm_paths, case_sensitive, sep))
+                               norm_paths=norm_paths,
+                               case_sensitive=case_sensitive, sep=sep,
+                               exclude=exclude, gitignore=gitignore,
+                               limit=limit, min_depth=min_depth,
+                               max_depth=max_depth, with_stat=with_stat,
+                               type=type, min_size=min_size,
+                               max_size=max_size, newer_than=newer_than,
+                               older_than=older_than, predicate=predicate,
+                               sort=sort, followlinks=followlinks,
+                               one_filesystem=one_filesystem))
 
     def iglob(self, pathname, with_matches=False, include_hidden=False, recursive=True,
-              norm_paths=True, case_sensitive=True, sep=None):
+              norm_paths=True, case_sensitive=True, sep=None, exclude=None,
+              gitignore=False, limit=None, min_depth=None, max_depth=None,
+              with_stat=False, type=None, min_size=None, max_size=None,
+              newer_than=None, older_than=None, predicate=None, sort=False,
+              followlinks=False, one_filesystem=False):
         """Return an iterator which yields the paths matching a pathname
         pattern.
 
@@ -77,121 +197,774 @@ class Globber(object):
 
         If ``include_hidden`` is True, then files and folders starting with
         a dot are also returned.
+
+        ``exclude`` is a pattern, or a list of patterns, for files and
+        directories to leave out; excluded directories are not even
+        looked into. A pattern without a slash (other than a trailing one)
+        applies to the name of an item at any level, like ``__pycache__``
+        or ``*.pyc``; any other is matched against the path, relative to
+        where the search starts. A trailing slash only excludes
+        directories. If ``gitignore`` is True, the ``.gitignore`` files
+        encountered along the way are honoured as well.
+
+        Only the first ``limit`` matches are returned; the search stops
+        right there, so ``limit=1`` quickly answers whether there is any
+        match at all. ``min_depth`` and ``max_depth`` restrict the matches
+        to those as many levels below the directory the pattern's leading
+        literal part names (like ``find``'s options of the same names):
+        ``src/**/*.py`` with ``max_depth=1`` matches ``src/setup.py``
+        but not ``src/pkg/__init__.py``; directories too deep to hold a
+        match are not looked into.
+
+        If ``with_stat`` is True, a :class:`GlobResult` is returned for
+        each match instead, which holds the groups as well, and tells the
+        type, size and modification time of the file, from the directory
+        listing the match was found in where possible.
+
+        The other options only let matches of a certain kind through,
+        checked as they are found: ``type`` is one of ``'f'``, ``'d'``
+        and ``'l'``, for regular files, directories and symbolic links
+        (like ``find -type``, links are not followed); ``min_size`` and
+        ``max_size`` are in bytes, and ``newer_than`` and ``older_than``
+        are timestamps the modification time is compared to. Finally,
+        ``predicate`` is called with the :class:`GlobResult` of every
+        match left, and decides whether to return it. File types are
+        taken from the directory listings; the sizes and times need a
+        ``stat`` call (``self.stat``, on a custom storage).
+
+        If ``sort`` is True, the paths are returned in sorted order, as
+        ``sorted()`` would put them, but still one by one as the search
+        goes on, rather than all at the end.
+
+        ``**`` does not follow links to directories, unless
+        ``followlinks`` is True; even then, it does not follow one back
+        into a directory it is already in, so that loops of links end.
+        With ``one_filesystem``, ``**`` does not enter directories on
+        another filesystem than the one they are in. Either option takes
+        a ``stat`` call per directory searched.
         """
-        result = self._iglob(pathname, True, include_hidden,
-                             norm_paths, case_sensitive, sep)
-        if with_matches:
+        criteria = _Criteria.from_options(type, min_size, max_size,
+                                          newer_than, older_than, predicate)
+        result = self._iglob(pathname, include_hidden, norm_paths,
+                             case_sensitive, sep, exclude, gitignore,
+                             limit, min_depth, max_depth, with_stat, criteria,
+                             sort, followlinks, one_filesystem)
+        if with_matches or with_stat:
             return result
         return imap(lambda s: s[0], result)
 
-    def _iglob(self, pathname, rootcall, include_hidden,
-               norm_paths, case_sensitive, sep):
+    def glob_many(self, patterns, with_matches=False, include_hidden=False,
+                  norm_paths=True, case_sensitive=True, sep=None, exclude=None,
+                  gitignore=False, limit=None, min_depth=None, max_depth=None,
+                  type=None, min_size=None, max_size=None, newer_than=None,
+                  older_than=None, predicate=None, sort=False,
+                  followlinks=False, one_filesystem=False):
+        """Return a list of the paths matching any of ``patterns``.
+
+        See :meth:`iglob_many`.
+        """
+        return list(self.iglob_many(patterns, with_matches, include_hidden,
+                                    norm_paths, case_sensitive, sep,
+                                    exclude, gitignore, limit,
+                                    min_depth, max_depth, type, min_size,
+                                    max_size, newer_than, older_than,
+                                    predicate, sort, followlinks,
+                                    one_filesystem))
+
+    def iglob_many(self, patterns, with_matches=False, include_hidden=False,
+                   norm_paths=True, case_sensitive=True, sep=None, exclude=None,
+                   gitignore=False, limit=None, min_depth=None, max_depth=None,
+                   type=None, min_size=None, max_size=None, newer_than=None,
+                   older_than=None, predicate=None, sort=False,
+                   followlinks=False, one_filesystem=False):
+        """Like :meth:`iglob`, but for several patterns at once, which
+        are resolved together in a single pass: every directory is read
+        at most once, however many of the patterns look at it.
+
+        Yields a 2-tuple for every path that matched: the path, and the
+        patterns it matched, in the order they were given. If
+        ``with_matches`` is True, the latter is a tuple of
+        ``(pattern, groups)`` pairs instead.
+
+        ``limit`` counts the paths yielded; ``min_depth`` and ``max_depth``
+        apply to every pattern on its own, the other options to every
+        path.
+        """
+        patterns = list(patterns)
+        if limit == 0:
+            return
+        criteria = _Criteria.from_options(type, min_size, max_size,
+                                          newer_than, older_than, predicate)
+        program = _Program(patterns, include_hidden, norm_paths,
+                           case_sensitive, sep, exclude, gitignore,
+                           min_depth, max_depth, criteria, sort, followlinks,
+                           one_filesystem)
+        steps = self._iter_steps(program)
+        count = 0
+        try:
+            for results in steps:
+                matched = {}
+                order = []
+                for path, index, groups, _ in results:
+                    if path not in matched:
+                        matched[path] = {}
+                        order.append(path)
+                    matched[path].setdefault(index, groups)
+                for path in order:
+                    hits = sorted(matched[path].items())
+                    if with_matches:
+                        yield path, tuple((patterns[i], g) for i, g in hits)
+                    else:
+                        yield path, tuple(patterns[i] for i, _ in hits)
+                    count += 1
+                    if count == limit:
+                        return
+        finally:
+            steps.close()
+
+    def compile(self, pathname, include_hidden=False, norm_paths=True,
+                case_sensitive=True, sep=None, exclude=None, gitignore=False,
+                min_depth=None, max_depth=None, type=None, min_size=None,
+                max_size=None, newer_than=None, older_than=None,
+                predicate=None, sort=False, followlinks=False,
+                one_filesystem=False):
+        """Compile a pathname pattern, with the options of :meth:`iglob`,
+        into a :class:`GlobPattern`, to glob it (below any directory)
+        again and again, or match paths against it in memory, without
+        parsing it every time.
+        """
+        criteria = _Criteria.from_options(type, min_size, max_size,
+                                          newer_than, older_than, predicate)
+        program = _Program([pathname], include_hidden, norm_paths,
+                           case_sensitive, sep, exclude, gitignore,
+                           min_depth, max_depth, criteria, sort, followlinks,
+                           one_filesystem)
+        program.compile_filters()
+        return GlobPattern(self, pathname, program)
+
+    def _iglob(self, pathname, include_hidden, norm_paths, case_sensitive, sep,
+               exclude=None, gitignore=False, limit=None, min_depth=None,
+               max_depth=None, with_stat=False, criteria=None, sort=False,
+               followlinks=False, one_filesystem=False):
         """Internal implementation that backs :meth:`iglob`.
 
-        ``rootcall`` is required to differentiate between the user's call to
-        iglob(), and subsequent recursive calls, for the purposes of resolving
-        certain special cases of ** wildcards. Specifically, "**" is supposed
-        to include the current directory for purposes of globbing, but the
-        directory itself should never be returned. So if ** is the lastmost
-        part of the ``pathname`` given the user to the root call, we want to
-        ignore the current directory. For this, we need to know which the root
-        call is.
+        The pattern is compiled into one matcher per path segment (see
+        :class:`_Program`), and the tree is then descended only into
+        those directories which some segment can still match. Every
+        directory is read at most once, no matter how many wildcards
+        (including ``**``) apply to it.
+
+        Returns an iterator of ``(path, groups)`` pairs, or of
+        :class:`GlobResult` objects with ``with_stat``. The search stops
+        as soon as ``limit`` matches have been yielded.
         """
+        if limit == 0:
+            return iter(())
 
-        # Short-circuit if no glob magic
-        if not has_magic(pathname):
-            if self.exists(pathname):
-                yield pathname, ()
+        # Short-circuit if no glob magic (and nothing else to check)
+        if (not has_magic(pathname) and criteria is None and
+                not exclude and not gitignore):
+            return self._iglob_literal(pathname, with_stat, min_depth, max_depth)
+
+        program = _Program([pathname], include_hidden, norm_paths,
+                           case_sensitive, sep, exclude, gitignore,
+                           min_depth, max_depth, criteria, sort, followlinks,
+                           one_filesystem)
+        return self._iglob_program(program, with_stat, limit)
+
+    def _iglob_literal(self, pathname, with_stat, min_depth, max_depth):
+        # The depth of a literal path is 1, since the directory it is in
+        # is what the depth counts from.
+        if ((not min_depth or min_depth <= 1) and
+                (max_depth is None or max_depth >= 1) and
+                self.exists(pathname)):
+            yield GlobResult(pathname, (), None, self) if with_stat else (pathname, ())
+
+    def _iglob_program(self, program, with_stat, limit):
+        """Yield the matches of the single pattern ``program`` is made of;
+        see :meth:`_iglob`.
+        """
+        if limit == 0:
             return
+        steps = self._iter_steps(program)
+        count = 0
+        try:
+            for results in steps:
+                if program.expanded:
+                    results = _unique(results)
+                for path, _, groups, entry in results:
+                    if with_stat:
+                        yield GlobResult(path, groups, entry, self)
+                    else:
+                        yield path, groups
+                    count += 1
+                    if count == limit:
+                        return
+        finally:
+            steps.close()
 
-        # If no directory part is left, assume the working directory
-        dirname, basename = os.path.split(pathname)
-
-        # If the directory is globbed, recurse to resolve.
-        # If at this point there is no directory part left, we simply
-        # continue with dirname="", which will search the current dir.
-        # `os.path.split()` returns the argument itself as a dirname if it is a
-        # drive or UNC path.  Prevent an infinite recursion if a drive or UNC path
-        # contains magic characters (i.e. r'\\?\C:').
-        if dirname != pathname and has_magic(dirname):
-            # Note that this may return files, which will be ignored
-            # later when we try to use them as directories.
-            # Prefiltering them here would only require more IO ops.
-            dirs = self._iglob(dirname, False, include_hidden,
-                               norm_paths, case_sensitive, sep)
-        else:
-            dirs = [(dirname, ())]
+    def _iter_steps(self, program):
+        """Resolve ``program`` one directory at a time, depth first, and
+        yield the list of matches found in each of them.
+
+        If ``program.sort`` is set, yield the matches in sorted order
+        instead, as soon as no directory left to search could hold a
+        match to come before them (see :class:`_Frontier`).
+        """
+        if program.sort:
+            frontier = _Frontier(program)
+            while True:
+                results, node = frontier.pop()
+                if results:
+                    yield results
+                if node is None:
+                    return
+                frontier.add(*self._step(program, node))
 
-        # Resolve ``basename`` expr for every directory found
-        for dirname, dir_groups in dirs:
-            for name, groups in self.resolve_pattern(dirname, basename,
-                                                     not rootcall, include_hidden,
-                                                     norm_paths, case_sensitive, sep):
-                yield _join_paths([dirname, name], sep=sep), dir_groups + groups
+        stack = list(reversed(program.roots))
+        while stack:
+            results, children = self._step(program, stack.pop())
+            if results:
+                yield results
+            stack.extend(reversed(children))
 
-    def resolve_pattern(self, dirname, pattern, globstar_with_root, include_hidden,
-                        norm_paths, case_sensitive, sep):
-        """Apply ``pattern`` (contains no path elements) to the
-        literal directory in ``dirname``.
+    def _step(self, program, node):
+        """Run :meth:`_resolve` for ``node``, making the filesystem calls
+        it asks for.
+        """
+        resolve = self._resolve(program, node)
+        request = next(resolve)
+        while request[0] is not None:
+            method, path = request
+            try:
+                reply = getattr(self, method)(path)
+            except (IOError, OSError) as err:
+                request = resolve.throw(err)
+            else:
+                request = resolve.send(reply)
+        return request[1]
+
+    def _resolve(self, program, node):
+        """Apply the pattern segments that are active at directory
+        ``node`` to its contents.
 
-        If pattern=='', this will filter for directories. This is
-        a special case that happens when the user's glob expression ends
-        with a slash (in which case we only want directories). It simpler
-        and faster to filter here than in :meth:`_iglob`.
+        See :class:`_Node`; each thread is a ``(state, groups)`` pair,
+        ``state`` indexing the segments of ``program``, and the groups
+        being the matches collected on the way to this directory.
+
+        This is a generator, which does not touch the filesystem itself,
+        so that it can be driven both synchronously (:meth:`_step`) and
+        asynchronously: it yields ``(method name, path)`` for every call
+        to be made, expecting the result (or exception) to be sent back
+        in. Finally it yields ``(None, (results, children))``: the matches
+        found directly in this directory, as ``(path, pattern index,
+        groups, entry)`` (the entry being None where the match was not
+        found in a listing), and the subdirectories to continue with, as nodes in
+        turn.
         """
+        path, threads, known_dir = node.path, node.threads, node.known_dir
+        sep = program.sep
+        depth = node.depth + 1
+        check_depth = program.check_depth
+        results = []
+        children = []
+        child_index = {}
 
-        if sys.version_info[0] == 3:
-            if isinstance(pattern, bytes):
-                dirname = bytes(os.curdir, 'ASCII')
-        else:
-            if isinstance(pattern, unicode) and not isinstance(dirname, unicode):
-                dirname = unicode(dirname, sys.getfilesystemencoding() or
-                                           sys.getdefaultencoding())
-
-        # If no magic, short-circuit, only check for existence
-        if not has_magic(pattern):
-            if pattern == '':
-                if self.isdir(dirname):
-                    return [(pattern, ())]
+        def add_child(name, entry, child_threads, child_ident=None):
+            if program.max_depth is not None:
+                child_threads = program.within_depth(child_threads, depth)
+                if not child_threads:
+                    return
+            # Only a real directory listing tells us it is a directory.
+            is_dir = entry is not None and entry.__class__ is not _ListdirEntry
+            if name in child_index:
+                # Threads in a state the child has already would only
+                # find the same paths again (if with other groups).
+                child = children[child_index[name]]
+                child.threads = _distinct_threads(program,
+                                                  child.threads + child_threads)
+                child.known_dir = child.known_dir or is_dir
+                child.ident = child.ident or child_ident
             else:
-                if self.exists(_join_paths([dirname, pattern], sep=sep)):
-                    return [(pattern, ())]
-            return []
+                child_index[name] = len(children)
+                children.append(_Node(_join_paths([path, name], sep=sep),
+                                      child_threads, is_dir, rules, depth,
+                                      child_ident, chain))
 
-        if not dirname:
-            dirname = os.curdir
+        # Read the directory only if a wildcard needs to look at it;
+        # literal segments are resolved from the listing if there is one.
+        entries = None
+        if any(program.needs_listing[i] for i, _ in threads):
+            try:
+                entries = yield 'scandir', path or _curdir(path)
+            except os.error:
+                pass
 
-        try:
-            if pattern == '**':
-                # Include the current directory in **, if asked; by adding
-                # an empty string as opposed to '.', we spare ourselves
-                # having to deal with os.path.normpath() later.
-                names = [''] if globstar_with_root else []
-                for top, entries in self.walk(dirname, sep=sep):
-                    _mkabs = lambda s: _join_paths([top[len(dirname) + 1:], s], sep=sep)
-                    names.extend(map(_mkabs, entries))
-                # Reset pattern so that fnmatch(), which does not understand
-                # ** specifically, will only return a single group match.
-                pattern = '*'
+        # Where '**' follows links or stays on one filesystem, it needs to
+        # tell the directories apart: this one, and those it is in.
+        ident = chain = None
+        if program.track_ids:
+            ident = node.ident
+            if ident is None:
+                try:
+                    st = yield 'stat', path or _curdir(path)
+                    ident = (st.st_dev, st.st_ino)
+                except os.error:
+                    pass
+            if program.followlinks and ident is not None:
+                chain = (ident, node.ancestors)
+
+        rules = node.rules
+        ignore_file = program.gitignore and _gitignore_path(path, entries)
+        if ignore_file:
+            try:
+                lines = yield 'read_ignore_file', ignore_file
+            except (IOError, OSError):
+                lines = ()
+            # Read as text, but bytes patterns match bytes names.
+            lines = [_like(line, path) for line in lines]
+            rules = rules + _parse_rules(lines, path, gitignore=True)
+
+        if entries is not None:
+            names = [entry.name for entry in entries]
+            by_name = dict(zip(names, entries))
+            if rules:
+                excluded = self._excluded(program, path, rules, names, by_name)
+                if excluded:
+                    names = [name for name in names if name not in excluded]
+                    for name in excluded:
+                        del by_name[name]
+            if program.include_hidden:
+                visible = names
             else:
-                names = self.listdir(dirname)
-        except os.error:
-            return []
+                visible = [name for name in names if not _ishidden(name)]
+
+        for i, groups in threads:
+            segment = program.segments[i]
+            kind = program.kinds[i]
+            owner = program.owners[i]
+            last = i == program.ends[i]
+            # Whether to return what this state matches last; the '/' of
+            # a directory-only pattern matches the directory we are in.
+            emit = last and (not check_depth or program.depth_ok(
+                i, node.depth if kind == _DIRONLY else depth))
 
-        if not include_hidden and not _ishidden(pattern):
-            # Remove hidden files, but take care to ensure
-            # that the empty string we may have added earlier remains.
-            # Do not filter out the '' that we might have added earlier
-            names = filter(lambda x: not x or not _ishidden(x), names)
-        return fnmatch.filter(names, pattern, norm_paths, case_sensitive, sep)
+            if kind == _GLOBSTAR:
+                if entries is None:
+                    continue
+                # Like '*', the first level of '**' skips hidden items
+                # (and whatever is below them).
+                head, acc = groups[:-1], groups[-1]
+                followlinks = program.followlinks
+                for name in (acc and names or visible):
+                    entry = by_name[name]
+                    rel = program.join_group(acc, name)
+                    target = _join_paths([path, name], sep=sep)
+                    if emit:
+                        results.append((target, owner,
+                                        head + (rel,) + program.padding[i], entry))
+                    if entry.__class__ is _ListdirEntry:
+                        # Type unknown; as always, let listdir() find out
+                        # whether this is a directory.
+                        linked = yield 'islink', target
+                        descend = not linked or followlinks
+                    else:
+                        descend = entry.is_dir(follow_symlinks=False)
+                        linked = (not descend and (followlinks or not last) and
+                                  entry.is_dir())
+                        descend = descend or linked and followlinks
+                    child_ident = None
+                    if descend and ident is not None:
+                        try:
+                            st = _entry_stat(entry)
+                            if st is None:
+                                st = yield 'stat', target
+                            child_ident = (st.st_dev, st.st_ino)
+                        except os.error:
+                            pass
+                        if child_ident is not None and (
+                                program.one_filesystem and child_ident[0] != ident[0] or
+                                linked and _in_chain(child_ident, chain)):
+                            # '**' stops here, as at a link not followed.
+                            descend, linked = False, True
+                    if descend:
+                        add_child(name, entry, program.resume(i, head + (rel,)),
+                                  child_ident)
+                    elif linked and not last:
+                        # A link to a directory: '**' stops here, but the
+                        # rest of the pattern still applies to its contents.
+                        add_child(name, entry, program.enter(
+                            i + 1, head + (rel,) + program.padding[i]))
+
+            elif kind == _MAGIC:
+                if entries is None:
+                    continue
+                if program.include_hidden or _ishidden(segment):
+                    candidates = names
+                else:
+                    candidates = visible
+                for name, match in program.filter(candidates, segment):
+                    if last:
+                        if emit:
+                            results.append((_join_paths([path, name], sep=sep),
+                                            owner, groups + match,
+                                            by_name[name]))
+                    elif self._may_descend(by_name[name], True):
+                        add_child(name, by_name[name],
+                                  program.enter(i + 1, groups + match))
+
+            elif kind == _DIRONLY:
+                # Trailing slash: the directory we are in is the match.
+                # The directory the search starts in is never returned,
+                # though.
+                if emit and path and (known_dir or (yield 'isdir', path)):
+                    results.append((_join_paths([path, segment], sep=sep),
+                                    owner, groups, None))
+
+            else:
+                if last and not emit:
+                    continue
+                if kind == _LITERAL_SET:
+                    alternatives = program.alternatives[i]
+                else:
+                    alternatives = ((segment, ()),)
+                for name, match in alternatives:
+                    entry = None
+                    if entries is not None and name not in _SPECIAL_DIRS:
+                        # Look the name up in the listing we have anyway,
+                        # rather than asking the filesystem about it.
+                        entry = program.lookup(names, by_name, name)
+                        if entry is None:
+                            continue
+                    elif rules and self._excluded(program, path, rules, [name],
+                                                  {}, not last):
+                        continue
+                    if not last:
+                        if entry is None or self._may_descend(entry, True):
+                            add_child(name, entry,
+                                      program.enter(i + 1, groups + match))
+                        continue
+                    target = _join_paths([path, name], sep=sep)
+                    if entry is not None or (yield 'exists', target):
+                        results.append((target, owner, groups + match, entry))
+
+        criteria = program.criteria
+        if criteria is not None and results:
+            kept = []
+            for result in results:
+                target, entry = result[0], result[3]
+                if criteria.file_type is not None:
+                    if entry is not None and entry.__class__ is not _ListdirEntry:
+                        file_type = criteria.type_of(entry)
+                    elif (yield 'islink', target):
+                        file_type = 'l'
+                    else:
+                        file_type = 'd' if (yield 'isdir', target) else 'f'
+                    if file_type != criteria.file_type:
+                        continue
+                if criteria.needs_stat:
+                    try:
+                        if hasattr(entry, 'stat'):
+                            # A DirEntry caches it, for with_stat.
+                            st = entry.stat()
+                        else:
+                            st = yield 'stat', target
+                    except os.error:
+                        continue
+                    if not criteria.stat_ok(st):
+                        continue
+                if criteria.predicate is not None:
+                    if self._blocking_stat:
+                        found = GlobResult(target, result[2], entry, self)
+                    else:
+                        # The predicate cannot await the filesystem
+                        # methods: ask for what it may want to know first.
+                        fetch = self._fetch_result(target, result[2], entry)
+                        request = next(fetch)
+                        while request[0] is not None:
+                            try:
+                                reply = yield request
+                            except (IOError, OSError) as err:
+                                request = fetch.throw(err)
+                            else:
+                                request = fetch.send(reply)
+                        found = request[1]
+                    if not criteria.predicate(found):
+                        continue
+                kept.append(result)
+            results = kept
+
+        yield None, (results, children)
+
+    def _fetch_result(self, path, groups, entry):
+        """Ask for the type and stat of ``path``, the way :meth:`_resolve`
+        asks for what it needs, and finally yield ``(None, result)``: a
+        :class:`GlobResult` which does not need to call the filesystem
+        methods later. For globbers whose methods are coroutines.
+        """
+        if hasattr(entry, 'stat'):
+            # A DirEntry from the local filesystem can stat itself.
+            yield None, GlobResult(path, groups, entry)
+            return
+        if entry is None or entry.__class__ is _ListdirEntry:
+            is_link = yield 'islink', path
+            is_dir = yield 'isdir', path
+            top, name = os.path.split(path)
+            entry = _StaticEntry(top, name, is_dir, is_link)
+        answers = {}
+        for method in ('stat', 'lstat') if entry.is_symlink() else ('stat',):
+            try:
+                answers[method] = yield method, path
+            except (IOError, OSError) as err:
+                answers[method] = err
+        yield None, GlobResult(path, groups, entry, _FetchedStat(answers))
+
+    def _excluded(self, program, path, rules, names, by_name, assume_dir=False):
+        """Return the set of ``names`` in directory ``path`` which
+        ``rules`` exclude. Later rules take precedence over earlier ones,
+        which is how negated ``.gitignore`` rules work.
+
+        Where the type of an entry is unknown (custom ``listdir``), rules
+        for directories only apply to it regardless.
+        """
+        excluded = set()
+        for rule in rules:
+            pattern, anchored, negate, dironly, base = rule
+            if anchored:
+                parts = _split_relpath(path, base)
+                matched = set(name for name in names
+                              if program.match_parts(pattern, parts + [name]))
+            else:
+                matched = set(name for name, _ in program.filter(names, pattern))
+            if dironly:
+                matched = set(name for name in matched
+                              if (self._may_descend(by_name[name], True)
+                                  if name in by_name else assume_dir))
+            if negate:
+                excluded -= matched
+            else:
+                excluded |= matched
+        return excluded
+
+    def read_ignore_file(self, path):
+        """Return the lines of the ``.gitignore`` file ``path``, for the
+        ``gitignore`` option; raises ``IOError`` if there is none.
+        """
+        with io.open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().splitlines()
+
+    def resolve_pattern(self, dirname, pattern, globstar_with_root, include_hidden,
+                        norm_paths, case_sensitive, sep):
+        """Apply ``pattern`` (contains no path elements) to the
+        literal directory in ``dirname``.
+
+        If pattern=='', this will filter for directories.
+
+        This is no longer used by :meth:`iglob`, which resolves all the
+        segments of a pattern in a single pass, but is kept for anybody
+        calling it directly.
+        """
+        if not pattern:
+            # The trailing slash of a pattern: only directories match.
+            return [(pattern, ())] if self.isdir(dirname or _curdir(pattern)) else []
+        results = []
+        if pattern in ('**', b'**') and globstar_with_root:
+            results.append((pattern[:0], (pattern[:0],)))
+        program = _Program([pattern], include_hidden, norm_paths,
+                           case_sensitive, sep)
+        program.roots = [_Node(dirname, root.threads, False, root.rules)
+                         for root in program.roots]
+        prefix = len(_join_paths([dirname, pattern[:0]], sep=sep)) if dirname else 0
+        for step in self._iter_steps(program):
+            for path, _, groups, _ in step:
+                results.append((path[prefix:], groups))
+        return results
 
 
 default_globber = Globber()
 glob = default_globber.glob
 iglob = default_globber.iglob
+glob_many = default_globber.glob_many
+iglob_many = default_globber.iglob_many
+compile = default_globber.compile
 del default_globber
 
 
+class GlobResult(object):
+    """A match of :meth:`Globber.iglob` with ``with_stat=True``: its
+    ``path`` and the ``groups`` its wildcards matched, along with what is
+    known about the file.
+
+    The type comes from the directory listing the match was found in,
+    without a syscall on the local filesystem. ``stat()`` (and ``size``
+    and ``mtime``) call the ``stat`` method of the ``globber`` that found
+    it (``os.stat`` without one) once, then remember the answer; on
+    Windows, the listing already holds that, too.
+    """
+
+    __slots__ = ('path', 'groups', '_entry', '_globber', '_stat', '_lstat')
+
+    def __init__(self, path, groups, entry=None, globber=None):
+        self.path = path
+        self.groups = groups
+        self._entry = entry
+        self._globber = globber
+        self._stat = self._lstat = None
+
+    def stat(self, follow_symlinks=True):
+        """Return the ``os.stat_result`` of the file, or of the link
+        itself if ``follow_symlinks`` is False.
+        """
+        if follow_symlinks:
+            if self._stat is None:
+                self._stat = self._get_stat(True)
+            return self._stat
+        if self._lstat is None:
+            self._lstat = self._get_stat(False)
+        return self._lstat
+
+    def _get_stat(self, follow_symlinks):
+        if hasattr(self._entry, 'stat'):
+            return self._entry.stat(follow_symlinks=follow_symlinks)
+        globber = self._globber
+        if globber is not None:
+            if follow_symlinks or (self._entry is not None and
+                                   not self._entry.is_symlink()):
+                return globber.stat(self.path)
+            return globber.lstat(self.path)
+        if follow_symlinks:
+            return os.stat(self.path)
+        return os.lstat(self.path)
+
+    def _has_mode(self, check, follow_symlinks):
+        try:
+            return check(self.stat(follow_symlinks).st_mode)
+        except os.error:
+            return False
+
+    def is_dir(self, follow_symlinks=True):
+        if self._entry is not None:
+            return self._entry.is_dir(follow_symlinks=follow_symlinks)
+        return self._has_mode(stat.S_ISDIR, follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        if hasattr(self._entry, 'is_file'):
+            return self._entry.is_file(follow_symlinks=follow_symlinks)
+        if self._entry.__class__ is _StaticEntry:
+            # The listing knew, and anything not a directory is a file.
+            return not self._entry.is_dir(follow_symlinks) and (
+                follow_symlinks or not self._entry.is_symlink())
+        if self._entry is not None and self._entry.is_dir(follow_symlinks):
+            return False
+        return self._has_mode(stat.S_ISREG, follow_symlinks)
+
+    def is_symlink(self):
+        if self._entry is not None:
+            return self._entry.is_symlink()
+        return self._has_mode(stat.S_ISLNK, False)
+
+    @property
+    def size(self):
+        return self.stat().st_size
+
+    @property
+    def mtime(self):
+        return self.stat().st_mtime
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.path)
+
+
+class _FetchedStat(object):
+    """Stands in for the globber of a :class:`GlobResult`, answering
+    ``stat`` and ``lstat`` with what was fetched ahead of time (or
+    raising the error that was).
+    """
+
+    __slots__ = ('_answers',)
+
+    def __init__(self, answers):
+        self._answers = answers
+
+    def stat(self, path):
+        return self._answer('stat')
+
+    def lstat(self, path):
+        # Only fetched for links; otherwise it is the same.
+        return self._answer('lstat' if 'lstat' in self._answers else 'stat')
+
+    def _answer(self, method):
+        answer = self._answers[method]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class GlobPattern(object):
+    """A pathname pattern compiled by :meth:`Globber.compile`: the
+    segments of the pattern are parsed, and its wildcards compiled, once
+    and for all.
+    """
+
+    def __init__(self, globber, pattern, program):
+        self.globber = globber
+        self.pattern = pattern
+        self._program = program
+
+    def iglob(self, root=None, with_matches=False, with_stat=False, limit=None):
+        """Like :meth:`Globber.iglob` for the pattern, a relative one
+        being searched below directory ``root`` rather than the current
+        one (the paths returned start with ``root``, then).
+        """
+        program = self._program if root is None else self._program.rebased(root)
+        result = self.globber._iglob_program(program, with_stat, limit)
+        if with_matches or with_stat:
+            return result
+        return imap(lambda s: s[0], result)
+
+    def glob(self, root=None, with_matches=False, with_stat=False, limit=None):
+        """Return the list of paths :meth:`iglob` yields."""
+        return list(self.iglob(root, with_matches, with_stat, limit))
+
+    def match(self, path):
+        """If ``path`` matches the pattern, return the groups of the
+        wildcards, like ``with_matches`` would; else None.
+
+        This does not touch the filesystem: every component of ``path``
+        but the last is taken for a directory (and the last one too, if
+        followed by a slash). Hidden names, ``exclude``, ``min_depth``
+        and ``max_depth`` work as for globbing; the options which need
+        to look at the files themselves (``gitignore``, ``type`` and
+        the like) are ignored.
+        """
+        found = self._program.match(path)
+        return None if found is None else found[1]
+
+    def filter(self, paths, with_matches=False):
+        """Return the list of the ``paths`` which match, or with
+        ``with_matches``, of ``(path, groups)`` pairs.
+        """
+        program = self._program
+        match = program.match
+        if with_matches:
+            return [(path, found[1]) for path, found in
+                    ((path, match(path)) for path in paths) if found is not None]
+        whole = program._whole
+        if whole is not None:
+            # No groups to build: the regular expression is all it takes.
+            double = b'//' if isinstance(self.pattern, bytes) else u'//'
+            return [path for path in paths if
+                    (whole(path) if double not in path else match(path))
+                    is not None]
+        return [path for path in paths if match(path) is not None]
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.pattern)
+
+
 magic_check = re.compile('[*?[]')
 magic_check_bytes = re.compile(b'[*?[]')
 
@@ -201,13 +974,752 @@ def has_magic(s):
         match = magic_check_bytes.search(s)
     else:
         match = magic_check.search(s)
-    return match is not None
+    return match is not None or fnmatch._has_braces(s)
+
+
+_LITERAL, _MAGIC, _GLOBSTAR, _DIRONLY, _LITERAL_SET = range(5)
+
+# Braces whose alternatives contain any of these are expanded into
+# separate patterns, rather than being matched within a segment.
+_SEPARATORS = tuple(set(sep for sep in ('/', os.sep, os.altsep) if sep))
+
+# Never part of a directory listing, but fine to use in a pattern.
+_SPECIAL_DIRS = (os.curdir, os.pardir,
+                 os.curdir.encode('ASCII'), os.pardir.encode('ASCII'))
+
+
+def _collapse_globstars(segments):
+    """Merge runs of ``**`` segments, which match no more than a single
+    one does, into one. Return the segments left, and for each of them
+    the empty groups to add to its own, for the ones merged into it.
+    """
+    kept, padding = [], []
+    for segment in segments:
+        if segment in ('**', b'**') and kept and kept[-1] == segment:
+            padding[-1] += (segment[:0],)
+        else:
+            kept.append(segment)
+            padding.append(())
+    return kept, padding
+
+
+def _split_path(path):
+    """:func:`_split_pattern`, done faster for a POSIX path without
+    repeated slashes, which is how most lists of paths come.
+    """
+    slash = b'/' if isinstance(path, bytes) else u'/'
+    if os.sep != '/' or os.altsep or slash + slash in path:
+        return _split_pattern(path)
+    if path[:1] == slash:
+        anchor, path = path[:1], path[1:]
+    else:
+        anchor = path[:0]
+    return anchor, path.split(slash) if path else []
+
+
+def _doubled_slash(path):
+    """Whether ``path`` has slashes in a row, which do not make an
+    empty path segment.
+    """
+    return (b'//' if isinstance(path, bytes) else u'//') in path
+
+
+def _split_pattern(pathname):
+    """Split ``pathname`` into the part that cannot be split any further
+    (``''``, the root directory, or a drive or UNC path), and the list of
+    path segments following it. A trailing slash results in a final
+    empty segment.
+    """
+    # `os.path.split()` returns the argument itself as a dirname if it
+    # is a drive or UNC path; that is where the segments end.
+    segments = []
+    while True:
+        head, tail = os.path.split(pathname)
+        if head == pathname:
+            return pathname, segments
+        segments.insert(0, tail)
+        pathname = head
+
+
+class _Program(object):
+    """One or more glob patterns, compiled into a flat list of states,
+    one per path segment: a literal name, a set of them (from braces),
+    a wildcard pattern, ``**``, or the directory-only marker of a
+    trailing slash. The states of every pattern run from its start state
+    to ``ends[state]``, and belong to pattern ``owners[state]``. A
+    pattern with braces spanning several segments becomes several
+    patterns here, all of them with the same owner.
+
+    The tree is searched starting at ``roots``, one node (see
+    :meth:`Globber._step`) per distinct drive or root directory that
+    the patterns start in.
+    """
+
+    def __init__(self, pathnames, include_hidden, norm_paths, case_sensitive, sep,
+                 exclude=None, gitignore=False, min_depth=None, max_depth=None,
+                 criteria=None, sort=False, followlinks=False,
+                 one_filesystem=False):
+        self.include_hidden = include_hidden
+        self.norm_paths = norm_paths
+        self.case_sensitive = case_sensitive
+        self.sep = sep
+        self.gitignore = gitignore
+        if isinstance(exclude, (str, bytes, type(u''))):
+            exclude = [exclude]
+        if exclude and pathnames:
+            exclude = [_like(rule, pathnames[0]) for rule in exclude]
+        self.exclude = exclude
+        self._filters = None
+        self._whole = None
+
+        self.segments = []
+        self.kinds = []
+        self.owners = []
+        self.ends = []
+        self.bases = []
+        self.padding = []
+        self.alternatives = {}
+        self.expanded = False
+        roots = {}
+        self.roots = []
+        for index, pathname in enumerate(pathnames):
+            variants = fnmatch._expand_braces(pathname, _SEPARATORS)
+            self.expanded = self.expanded or len(variants) > 1
+            for variant in variants:
+                anchor, segments = _split_pattern(variant)
+                if not segments:
+                    continue
+                segments, padding = _collapse_globstars(segments)
+                start = len(self.segments)
+                for segment, pad in zip(segments, padding):
+                    self._add_state(index, segment, start + len(segments) - 1)
+                    self.padding.append(pad)
+                self.bases.extend([self._base_depth(start, len(segments))] *
+                                  len(segments))
+                threads = self.enter(start, ())
+                if anchor in roots:
+                    root = self.roots[roots[anchor]]
+                    root.threads = root.threads + threads
+                else:
+                    roots[anchor] = len(self.roots)
+                    root = _join_paths([anchor], sep=sep)
+                    rules = _parse_rules(exclude or (), root)
+                    self.roots.append(_Node(root, threads, False, rules))
+
+        self.needs_listing = [kind in (_MAGIC, _GLOBSTAR) for kind in self.kinds]
+
+        # Literal names can be looked up directly, as long as matching
+        # them would not normalize anything.
+        self._exact = case_sensitive and (
+            norm_paths is not True or os.path.normcase('A/') == 'A/')
+        self._normalize = fnmatch._normalizer(norm_paths, sep)
+
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.check_depth = bool(min_depth) or max_depth is not None
+        self.criteria = criteria
+        self.sort = sort
+        self.followlinks = followlinks
+        self.one_filesystem = one_filesystem
+        self.track_ids = followlinks or one_filesystem
+
+    def _add_state(self, owner, segment, end):
+        self.segments.append(segment)
+        self.owners.append(owner)
+        self.ends.append(end)
+        if segment in ('**', b'**'):
+            self.kinds.append(_GLOBSTAR)
+        elif not has_magic(segment):
+            self.kinds.append(_LITERAL if segment else _DIRONLY)
+        else:
+            names = fnmatch._expand_braces(segment)
+            if any(has_magic(name) for name in names):
+                self.kinds.append(_MAGIC)
+                return
+            # Only braces with literal alternatives: look every one of
+            # them up, rather than list the directory. What each of them
+            # would match, the pattern itself tells.
+            self.kinds.append(_LITERAL_SET)
+            unique = []
+            for name in names:
+                if name not in unique:
+                    unique.append(name)
+            self.alternatives[len(self.segments) - 1] = fnmatch.filter(
+                unique, segment, self.norm_paths, self.case_sensitive, self.sep)
+
+    def _base_depth(self, start, count):
+        """The depth that the ``min_depth`` and ``max_depth`` options of
+        the pattern whose ``count`` states begin at ``start`` count from:
+        that of the directory its leading literal segments lead to, like
+        the starting point of ``find``.
+        """
+        if count and self.kinds[start + count - 1] == _DIRONLY:
+            count -= 1
+        base = 0
+        while (base < count - 1 and
+               self.kinds[start + base] in (_LITERAL, _LITERAL_SET)):
+            base += 1
+        return base
+
+    def depth_ok(self, i, depth):
+        """Whether a match of state ``i`` at ``depth`` is within the depth
+        limits.
+        """
+        depth -= self.bases[i]
+        return ((not self.min_depth or depth >= self.min_depth) and
+                (self.max_depth is None or depth <= self.max_depth))
+
+    def within_depth(self, threads, depth):
+        """Those of ``threads`` which may still find matches within the
+        depth limits, once in a directory at ``depth``.
+        """
+        kept = []
+        for i, groups in threads:
+            below = self.max_depth - (depth - self.bases[i])
+            if below > 0 or below == 0 and self.kinds[i] == _DIRONLY:
+                kept.append((i, groups))
+        return kept
+
+    def enter(self, i, groups):
+        """The threads for arriving at state ``i`` with ``groups``."""
+        if self.kinds[i] == _GLOBSTAR:
+            return self.resume(i, groups + (self.segments[i][:0],))
+        return [(i, groups)]
+
+    def resume(self, i, groups):
+        """The threads for being inside ``**`` state ``i``, whose match
+        so far is the last of ``groups``: it may match more directories,
+        or the segments after it may take over from here. A trailing
+        ``**`` never matches the directory it is applied to, only
+        what is inside of it.
+        """
+        threads = [(i, groups)]
+        if i < self.ends[i]:
+            threads.extend(self.enter(i + 1, groups + self.padding[i]))
+        return threads
+
+    def path_state(self, i, groups):
+        """What decides which paths a thread in state ``i`` can match:
+        the state, and for ``**``, whether it has matched anything yet
+        (until it has, it skips hidden names).
+        """
+        if self.kinds[i] == _GLOBSTAR:
+            return i, bool(groups[-1])
+        return i, False
+
+    def join_group(self, acc, name):
+        path = _join_paths([acc, name], sep=self.sep)
+        if self._normalize is None:
+            return path
+        return self._normalize(path)
+
+    def filter(self, names, segment):
+        if self._filters is not None:
+            compiled = self._filters.get(segment)
+            if compiled is not None:
+                return compiled(names)
+        return fnmatch.filter(names, segment, self.norm_paths,
+                              self.case_sensitive, self.sep)
+
+    def compile_filters(self):
+        """Compile the wildcard segments and exclude patterns for good,
+        rather than look them up in the cache of :mod:`fnmatch` every
+        time they are used.
+        """
+        patterns = [segment for segment, kind in zip(self.segments, self.kinds)
+                    if kind == _MAGIC]
+        for rule in self.roots[0].rules if self.roots else ():
+            if rule[1]:
+                patterns.extend(rule[0])
+            else:
+                patterns.append(rule[0])
+        self._filters = dict(
+            (pattern, fnmatch._CompiledFilter(pattern, self.norm_paths,
+                                              self.case_sensitive, self.sep))
+            for pattern in patterns)
+        self._whole = self._whole_path_regex()
+
+    def _whole_path_regex(self):
+        """A single regular expression for :meth:`match`, which matches
+        the same paths with the same groups (but None for an empty
+        ``**``), rather than the pattern being run segment by segment;
+        or None, where the pattern does not lend itself to that. With
+        several ``**``, a path may be split between them in more than
+        one way, and the regular expression would not take the one
+        globbing does.
+        """
+        if (self.expanded or len(self.roots) != 1 or self.roots[0].rules or
+                self.kinds.count(_GLOBSTAR) > 1 or
+                self.check_depth or not self._exact or
+                self._normalize is not None or self.sep not in (None, '/') or
+                os.sep != '/' or os.altsep):
+            return None
+        is_bytes = isinstance(self.segments[0], bytes)
+        segments = [self.roots[0].path] + self.segments
+        if is_bytes:
+            segments = [s.decode('ISO-8859-1') for s in segments]
+        visible = '' if self.include_hidden else r'(?!\.)'
+        # The path the pattern starts in is never a match itself.
+        res = re.escape(segments.pop(0)) + r'(?!\Z)'
+        last = len(segments) - 1
+        for i, (segment, kind) in enumerate(zip(segments, self.kinds)):
+            if kind == _GLOBSTAR:
+                deeper = visible + '[^/]+(?:/[^/]+)*'
+                res += ('(%s)' if i == last else '(?:(%s)/)?') % deeper
+                res += '()' * len(self.padding[i])
+                continue
+            if kind == _LITERAL:
+                res += re.escape(segment)
+            elif kind != _DIRONLY:
+                # Names are never empty, and hidden ones need a pattern
+                # which is hidden too.
+                res += '(?=[^/])'
+                if kind == _MAGIC and not _ishidden(segment):
+                    res += visible
+                res += fnmatch._translate(segment, slash='/')
+            if i < last:
+                res += '/'
+        res = '(?s)' + res + r'\Z'
+        if is_bytes:
+            res = res.encode('ISO-8859-1')
+        return re.compile(res).match
+
+    def rebased(self, top):
+        """A copy of the program, in which relative patterns start in
+        directory ``top``.
+        """
+        program = copy.copy(self)
+        program._whole = None
+        program.roots = [
+            root if root.path else
+            _Node(top, root.threads, False, _parse_rules(self.exclude or (), top))
+            for root in self.roots]
+        return program
+
+    def match(self, path):
+        """Match ``path`` against the patterns in memory (see
+        :meth:`GlobPattern.match`), and return ``(pattern index,
+        groups)`` for the first way it matches, or None.
+        """
+        if self._whole is not None and not _doubled_slash(path):
+            found = self._whole(path)
+            if found is None:
+                return None
+            empty = path[:0]
+            return self.owners[0], tuple(empty if group is None else group
+                                         for group in found.groups())
+        anchor, parts = _split_path(path)
+        anchor = _join_paths([anchor], sep=self.sep)
+        for root in self.roots:
+            if root.path == anchor:
+                break
+        else:
+            return None
+        if root.rules and self._excludes(root.rules, parts):
+            return None
+
+        threads = root.threads
+        final = len(parts) - 1
+        for depth, part in enumerate(parts):
+            hidden = part and not self.include_hidden and _ishidden(part)
+            advanced = []
+            for i, groups in threads:
+                kind = self.kinds[i]
+                last = i == self.ends[i]
+                if kind == _DIRONLY:
+                    # Only a trailing slash (an empty last part) matches.
+                    if depth == final and not part and (
+                            not self.check_depth or self.depth_ok(i, depth)):
+                        return self.owners[i], groups
+                    continue
+                if not part:
+                    continue
+                if kind == _GLOBSTAR:
+                    head, acc = groups[:-1], groups[-1]
+                    if hidden and not acc:
+                        continue
+                    matched = head + (self.join_group(acc, part),)
+                    if depth < final:
+                        advanced.extend(self.resume(i, matched))
+                    elif last and (not self.check_depth or
+                                   self.depth_ok(i, depth + 1)):
+                        return self.owners[i], matched + self.padding[i]
+                    continue
+                if kind == _MAGIC:
+                    if hidden and not _ishidden(self.segments[i]):
+                        continue
+                    matches = [m for _, m in self.filter([part], self.segments[i])]
+                elif kind == _LITERAL_SET:
+                    matches = [m for name, m in self.alternatives[i]
+                               if self.lookup([part], {part: part}, name)]
+                else:
+                    matches = [()] if self.lookup(
+                        [part], {part: part}, self.segments[i]) else []
+                for match in matches:
+                    if depth < final:
+                        if not last:
+                            advanced.extend(self.enter(i + 1, groups + match))
+                    elif last and (not self.check_depth or
+                                   self.depth_ok(i, depth + 1)):
+                        return self.owners[i], groups + match
+            threads = _distinct_threads(self, advanced)
+        return None
+
+    def _excludes(self, rules, parts):
+        """Whether ``rules`` exclude the path made of ``parts``, or any
+        directory it is in.
+        """
+        for depth, name in enumerate(parts):
+            if not name:
+                continue
+            is_dir = depth < len(parts) - 1
+            excluded = False
+            for pattern, anchored, negate, dironly, _ in rules:
+                if dironly and not is_dir:
+                    continue
+                if anchored:
+                    hit = self.match_parts(pattern, parts[:depth + 1])
+                else:
+                    hit = bool(self.filter([name], pattern))
+                if hit:
+                    excluded = not negate
+            if excluded:
+                return True
+        return False
+
+    def match_parts(self, segments, parts):
+        """Whether the path ``parts`` match the pattern ``segments`` one
+        by one, ``**`` matching any number of parts.
+        """
+        if not segments:
+            return not parts
+        segment = segments[0]
+        if segment in ('**', b'**'):
+            return any(self.match_parts(segments[1:], parts[i:])
+                       for i in range(len(parts) + 1))
+        if not parts or not any(self.filter([parts[0]], segment)):
+            return False
+        return self.match_parts(segments[1:], parts[1:])
+
+    def lookup(self, names, by_name, name):
+        """Find the entry for literal ``name`` in a directory listing,
+        matching it the same way a wildcard segment would be.
+        """
+        if self._exact:
+            return by_name.get(name)
+        for found, _ in self.filter(names, name):
+            return by_name[found]
+        return None
+
+
+class _Criteria(object):
+    """What matches must be like, other than their path, to be
+    returned: see :meth:`Globber.iglob`.
+    """
+
+    def __init__(self, file_type, min_size, max_size, newer_than, older_than,
+                 predicate):
+        if file_type not in (None, 'f', 'd', 'l'):
+            raise ValueError("type must be 'f', 'd' or 'l', not %r" % (file_type,))
+        self.file_type = file_type
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer_than = newer_than
+        self.older_than = older_than
+        self.predicate = predicate
+        self.needs_stat = not (min_size is None and max_size is None and
+                               newer_than is None and older_than is None)
+
+    @classmethod
+    def from_options(cls, *options):
+        """The criteria for these options, or None if there are none."""
+        if all(option is None for option in options):
+            return None
+        return cls(*options)
+
+    @staticmethod
+    def type_of(entry):
+        """The type of a directory entry, links not followed; None for
+        anything but a file, directory or link.
+        """
+        if entry.is_symlink():
+            return 'l'
+        if entry.is_dir(follow_symlinks=False):
+            return 'd'
+        if not hasattr(entry, 'is_file') or entry.is_file(follow_symlinks=False):
+            return 'f'
+        return None
+
+    def stat_ok(self, st):
+        return ((self.min_size is None or st.st_size >= self.min_size) and
+                (self.max_size is None or st.st_size <= self.max_size) and
+                (self.newer_than is None or st.st_mtime > self.newer_than) and
+                (self.older_than is None or st.st_mtime < self.older_than))
+
+
+class _Node(object):
+    """A directory to be searched: ``path``, the ``threads`` of the
+    program which are active in it, whether it is ``known_dir`` to be a
+    directory (as opposed to anything somebody asked for), and the
+    exclude ``rules`` which apply to it. Its ``depth`` is the number of
+    path components below the root of the search.
+
+    For the ``followlinks`` and ``one_filesystem`` options, ``ident`` is
+    its ``(st_dev, st_ino)`` if known already, and ``ancestors`` those
+    of the directories it is in, as a chain of ``(ident, ancestors)``
+    pairs.
+    """
+
+    __slots__ = ('path', 'threads', 'known_dir', 'rules', 'depth', 'ident',
+                 'ancestors')
+
+    def __init__(self, path, threads, known_dir, rules=(), depth=0,
+                 ident=None, ancestors=None):
+        self.path = path
+        self.threads = threads
+        self.known_dir = known_dir
+        self.rules = rules
+        self.depth = depth
+        self.ident = ident
+        self.ancestors = ancestors
+
+
+class _Frontier(object):
+    """Where a sorted search stands: the matches found but not returned
+    yet, and the directories still to be searched, in a heap ordered by
+    path. A directory goes by its path followed by a separator, which
+    nothing inside of it sorts before; so when a match comes first, no
+    match still to be found can come before it.
+    """
+
+    def __init__(self, program):
+        self.sep = program.sep
+        self._heap = []
+        self._count = itertools.count()
+        self.add((), program.roots)
+
+    def key(self, node):
+        return _join_paths([node.path, node.path[:0]], sep=self.sep)
+
+    def add(self, results, children):
+        heap, count = self._heap, self._count
+        for result in results:
+            heappush(heap, (result[0], 0, next(count), result))
+        for child in children:
+            heappush(heap, (self.key(child), 1, next(count), child))
+
+    def pop(self):
+        """Return the matches which come next, up to the next directory
+        to search, and that directory (None if there are no more).
+        """
+        results = []
+        while self._heap:
+            _, is_node, _, item = heappop(self._heap)
+            if is_node:
+                return results, item
+            results.append(item)
+        return results, None
+
+
+def _parse_rules(lines, base, gitignore=False):
+    """Parse exclude patterns into ``(pattern, anchored, negate, dironly,
+    base)`` rules. Anchored rules (any with a slash before the end) are
+    matched against the path relative to ``base`` instead of the name,
+    and hold the list of segments to match rather than a single pattern.
+
+    With ``gitignore``, ``lines`` are those of a ``.gitignore`` file:
+    blank lines and comments are skipped, and a leading ``!`` negates.
+    """
+    rules = []
+    for line in lines:
+        negate = False
+        if gitignore:
+            line = line.rstrip()
+            if not line or line[:1] in ('#', b'#'):
+                continue
+            if line[:1] in ('!', b'!'):
+                negate, line = True, line[1:]
+            elif line[:1] in ('\\', b'\\'):
+                line = line[1:]
+        slash = line[-1:]
+        dironly = slash in ('/', b'/')
+        if dironly:
+            line = line[:-1]
+        _, segments = _split_pattern(line)
+        anchored = len(segments) > 1 or line[:1] in ('/', b'/')
+        if not segments:
+            continue
+        pattern = segments if anchored else segments[0]
+        rules.append((pattern, anchored, negate, dironly, base))
+    return tuple(rules)
+
+
+def _gitignore_path(path, entries):
+    """The path of the ``.gitignore`` file in directory ``path``, unless
+    its listing ``entries`` shows there is none.
+    """
+    name = '.gitignore'
+    if isinstance(path, bytes) and not isinstance(path, str):
+        name = name.encode('ASCII')
+    if entries is not None and name not in [e.name for e in entries]:
+        return None
+    return _join_paths([path, name])
+
+
+def _split_relpath(path, base):
+    """The segments of ``path`` below its parent directory ``base``."""
+    if base:
+        path = path[len(base):]
+    _, segments = _split_pattern(path)
+    return [segment for segment in segments if segment]
+
+
+_FS_METHODS = ('listdir', 'isdir', 'islink')
+_native_classes = {}
+
+
+def _is_native(cls):
+    """Whether the filesystem methods of globber class ``cls``, past any
+    wrappers, are the stock ones of :class:`Globber`.
+    """
+    for name in _FS_METHODS:
+        for klass in cls.__mro__:
+            attrs = vars(klass)
+            if name in attrs and not attrs.get('_wraps_fs'):
+                if attrs[name] is not vars(Globber)[name]:
+                    return False
+                break
+    return True
+
+
+class _ListdirEntry(object):
+    """Stand-in for ``os.DirEntry`` on top of a custom ``listdir``."""
+
+    __slots__ = ('name', 'path', '_globber')
+
+    def __init__(self, globber, top, name):
+        self._globber = globber
+        self.name = name
+        self.path = join(top, name)
+
+    def is_dir(self, follow_symlinks=True):
+        if not follow_symlinks and self.is_symlink():
+            return False
+        return self._globber.isdir(self.path)
+
+    def is_symlink(self):
+        return self._globber.islink(self.path)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.name)
+
+
+def _entry_stat(entry):
+    """The stat of directory ``entry``, if it has one holding the device
+    and inode numbers (a ``DirEntry``, but not on Windows); else None.
+    """
+    if os.name == 'nt' or not hasattr(entry, 'stat'):
+        return None
+    return entry.stat()
+
+
+def _in_chain(ident, chain):
+    """Whether ``ident`` is in a chain of ``(ident, chain)`` pairs."""
+    while chain is not None:
+        if chain[0] == ident:
+            return True
+        chain = chain[1]
+    return False
+
+
+def _distinct_threads(program, threads):
+    """``threads``, leaving out those which would only match the same
+    paths as one before them (see :meth:`_Program.path_state`), and
+    those in a ``**`` state which has not matched anything yet, next to
+    one in the same state which has: the latter matches all the paths
+    the former would, and hidden ones besides.
+    """
+    if len(threads) < 2:
+        return threads
+    states = set(program.path_state(*thread) for thread in threads)
+    seen = set()
+    distinct = []
+    for thread in threads:
+        state = program.path_state(*thread)
+        if state in seen or not state[1] and (state[0], True) in states:
+            continue
+        seen.add(state)
+        distinct.append(thread)
+    return distinct
+
+
+def _unique(results):
+    """Drop the matches of paths matched before in ``results``; all
+    matches of a path are found in the same directory.
+    """
+    seen = set()
+    unique = []
+    for result in results:
+        if result[0] not in seen:
+            seen.add(result[0])
+            unique.append(result)
+    return unique
+
+
+def _curdir(path):
+    if isinstance(path, bytes) and not isinstance(path, str):
+        return os.curdir.encode('ASCII')
+    return type(path)(os.curdir)
+
+
+class _StaticEntry(object):
+    """Stand-in for ``os.DirEntry``, for listings which already know
+    the type of their entries.
+    """
+
+    __slots__ = ('name', 'path', '_dir', '_link')
+
+    def __init__(self, top, name, is_dir, is_symlink=False):
+        self.name = name
+        self.path = join(top, name)
+        self._dir = is_dir
+        self._link = is_symlink
+
+    def is_dir(self, follow_symlinks=True):
+        return self._dir and (follow_symlinks or not self._link)
+
+    def is_symlink(self):
+        return self._link
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.name)
 
 
 def _ishidden(path):
     return path[0] in ('.', b'.'[0])
 
 
+if sys.version_info[0] >= 3:
+    _fsencode, _fsdecode = os.fsencode, os.fsdecode
+else:
+    def _fsencode(path):
+        if isinstance(path, unicode):
+            return path.encode(sys.getfilesystemencoding() or 'utf-8')
+        return path
+
+    def _fsdecode(path):
+        return path.decode(sys.getfilesystemencoding() or 'utf-8')
+
+
+def _like(path, other):
+    """``path`` as text or bytes, whichever ``other`` is."""
+    if isinstance(other, bytes) and not isinstance(path, bytes):
+        return _fsencode(path)
+    if isinstance(path, bytes) and not isinstance(other, bytes):
+        return _fsdecode(path)
+    return path
+
+
 def _join_paths(paths, sep=None):
     path = join(*paths)
     if sep:
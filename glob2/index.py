@@ -0,0 +1,205 @@
+"""A globber which keeps the directory listings it reads in an index
+file, to be reused by later runs for the directories that did not change.
+"""
+
+from __future__ import absolute_import
+
+import mmap
+import os
+import struct
+import time
+
+from .impl import Globber, _fsdecode, _fsencode, _scandir, _StaticEntry
+
+
+__all__ = ('PersistentIndexGlobber',)
+
+
+# The index file is laid out as a header, followed by a table with one
+# fixed-size record per directory (sorted by path, so that it can be
+# binary searched right from the memory map), and then a blob holding
+# the paths and the listings those records point into. A listing is
+# the directory's entries, each a type byte followed by the name and a
+# NUL byte.
+_MAGIC = b'GLB2IDX1'
+_HEADER = struct.Struct('<8sQ')              # magic, number of directories
+_RECORD = struct.Struct('<QQqQQ')            # path offset and length, mtime,
+                                             # listing offset and length
+_FILE, _DIR, _LINK, _DIRLINK = [ord(c) for c in 'fdlD']
+
+# A listing taken within this many seconds of the directory's last
+# change may miss another change within the same mtime tick; it is kept,
+# but never trusted.
+_RACY = 2
+_UNTRUSTED = -1
+
+
+class PersistentIndexGlobber(Globber):
+    """Serves directory listings from the index file at ``index_path``
+    whenever the directory's mtime shows it has not changed since, and
+    records fresh listings of all the others.
+
+    Call :meth:`save` (or use the globber as a context manager) to write
+    the index back to disk, for the next run. Directories that were not
+    visited are kept in the index as they are, unless ``prune`` is set.
+
+    Checking a directory costs a single ``stat`` call, as opposed to
+    reading it. Loading the index maps the file into memory, and only
+    touches the parts that are looked up. An index file which is not
+    one, or is cut short, is taken for no index at all, and replaced on
+    :meth:`save`.
+
+    Keyword arguments other than ``index_path`` are passed on to the
+    other classes a custom globber derives from.
+    """
+
+    def __init__(self, index_path, **kwargs):
+        super(PersistentIndexGlobber, self).__init__(**kwargs)
+        self.index_path = index_path
+        self._updates = {}
+        self._visited = set()
+        self._file = self._map = None
+        self._count = 0
+        self._open()
+
+    def scandir(self, path):
+        if not self._native_fs():
+            return Globber.scandir(self, path)
+
+        key = _fsencode(os.path.abspath(path))
+        mtime = _mtime(os.stat(path))
+        self._visited.add(key)
+        record = self._updates.get(key) or self._lookup(key)
+        if record is not None and record[0] == mtime != _UNTRUSTED:
+            return _decode_listing(path, record[1])
+
+        entries = list(_scandir(path))
+        if time.time() - mtime / 1e9 < _RACY:
+            mtime = _UNTRUSTED
+        self._updates[key] = (mtime, _encode_listing(entries))
+        return entries
+
+    def save(self, prune=False):
+        """Write the index file, including everything learnt since it
+        was loaded. With ``prune``, only the directories visited since
+        are kept.
+        """
+        records = dict(self._updates)
+        for i in range(self._count):
+            key, mtime, listing = self._record(i)
+            if key in records or prune and key not in self._visited:
+                continue
+            records[key] = (mtime, listing)
+
+        tmp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(records)))
+            offset = 0
+            keys = sorted(records)
+            for key in keys:
+                mtime, listing = records[key]
+                f.write(_RECORD.pack(offset, len(key), mtime,
+                                     offset + len(key), len(listing)))
+                offset += len(key) + len(listing)
+            for key in keys:
+                f.write(key)
+                f.write(records[key][1])
+
+        self.close()
+        _replace(tmp_path, self.index_path)
+        self._updates = {}
+        self._open()
+
+    def close(self):
+        """Release the index file, without saving."""
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = self._map = None
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+        self.close()
+
+    def _open(self):
+        try:
+            self._file = open(self.index_path, 'rb')
+        except IOError:
+            return
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            return self.close()
+        if len(self._map) < _HEADER.size:
+            return self.close()
+        magic, count = _HEADER.unpack_from(self._map, 0)
+        if (magic != _MAGIC or
+                len(self._map) < _HEADER.size + count * _RECORD.size):
+            return self.close()
+        self._count = count
+        self._blob = _HEADER.size + count * _RECORD.size
+
+    def _record(self, i):
+        path_offset, path_len, mtime, offset, length = \
+            _RECORD.unpack_from(self._map, _HEADER.size + i * _RECORD.size)
+        start = self._blob + path_offset
+        key = self._map[start:start + path_len]
+        start = self._blob + offset
+        return key, mtime, self._map[start:start + length]
+
+    def _key(self, i):
+        path_offset, path_len = struct.unpack_from(
+            '<QQ', self._map, _HEADER.size + i * _RECORD.size)
+        start = self._blob + path_offset
+        return self._map[start:start + path_len]
+
+    def _lookup(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            found, mtime, listing = self._record(lo)
+            if found == key:
+                return mtime, listing
+        return None
+
+
+def _mtime(st):
+    return getattr(st, 'st_mtime_ns', None) or int(st.st_mtime * 1e9)
+
+
+def _encode_listing(entries):
+    parts = []
+    for entry in entries:
+        if entry.is_symlink():
+            kind = _DIRLINK if entry.is_dir() else _LINK
+        else:
+            kind = _DIR if entry.is_dir() else _FILE
+        parts.append(struct.pack('B', kind) + _fsencode(entry.name) + b'\0')
+    return b''.join(parts)
+
+
+def _decode_listing(path, listing):
+    entries = []
+    as_bytes = isinstance(path, bytes)
+    for item in listing.split(b'\0')[:-1]:
+        kind, name = ord(item[:1]), item[1:]
+        if not as_bytes:
+            name = _fsdecode(name)
+        entries.append(_StaticEntry(path, name,
+                                    kind in (_DIR, _DIRLINK),
+                                    kind in (_LINK, _DIRLINK)))
+    return entries
+
+
+_replace = getattr(os, 'replace', os.rename)
@@ -0,0 +1,150 @@
+"""A globber over a list of paths held in memory, such as the manifest
+of a build, rather than over the filesystem.
+"""
+
+from __future__ import absolute_import
+
+from bisect import bisect_left
+import errno
+import os
+
+from .impl import Globber, _StaticEntry
+
+
+__all__ = ('IndexedGlobber',)
+
+
+class IndexedGlobber(Globber):
+    """Globs over ``paths``, an iterable of slash-separated paths, as
+    if they were the files of a filesystem; the directories are those
+    the paths are in, and any path given with a trailing slash.
+
+    The paths are kept in a single sorted list, in which the contents of
+    every directory come in one run: ``exists`` and ``isdir`` are a
+    binary search, and listing a directory takes one per entry, skipping
+    over everything below its subdirectories. Literal segments of a
+    pattern are looked up directly, so globbing ``a/b/**`` only ever
+    looks at what is below ``a/b``, however long the list.
+
+    Relative paths in the list are relative to the directory the
+    patterns are relative to; ``./`` in front of them is ignored. Paths
+    are taken as they are otherwise, so should not contain ``..``,
+    repeated slashes, or the like. Either all of them are ``str`` or all
+    are ``bytes``, like the patterns.
+    """
+
+    def __init__(self, paths):
+        slash = None
+        keys = []
+        for path in paths:
+            if slash is None:
+                slash = b'/' if isinstance(path, bytes) else u'/'
+                dot = b'./' if isinstance(path, bytes) else u'./'
+            while path[:2] == dot:
+                path = path[2:]
+            if path:
+                keys.append(path)
+        keys.sort()
+        self._paths = keys
+        self._slash = slash or '/'
+        # The character sorting right after the slash: every path below
+        # directory 'd' sorts before 'd' followed by it.
+        self._after = (chr(ord('/') + 1).encode('ASCII')
+                       if isinstance(self._slash, bytes) else u'0')
+
+    def __len__(self):
+        return len(self._paths)
+
+    def scandir(self, path):
+        prefix = self._prefix(path)
+        paths, slash, after = self._paths, self._slash, self._after
+        i = bisect_left(paths, prefix)
+        entries = []
+        index = {}
+        found = False
+        while i < len(paths) and paths[i].startswith(prefix):
+            found = True
+            rest = paths[i][len(prefix):]
+            end = rest.find(slash)
+            if end < 0:
+                name, is_dir = rest, False
+                i += 1
+            else:
+                # Skip past everything below this subdirectory at once.
+                name, is_dir = rest[:end], True
+                i = bisect_left(paths, prefix + name + after, i)
+            if not name:
+                continue
+            if name in index:
+                # Both listed itself and with paths below it.
+                entries[index[name]]._dir = True
+                continue
+            index[name] = len(entries)
+            entries.append(_StaticEntry(path, name, is_dir))
+        if not found and prefix:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return entries
+
+    def listdir(self, path):
+        return [entry.name for entry in self.scandir(path)]
+
+    def exists(self, path):
+        if not path:
+            # Like os.path.lexists().
+            return False
+        key = self._key(path)
+        if not key or key == self._slash:
+            return True
+        if path[-1:] in (self._slash, os.sep, os.sep.encode('ASCII')):
+            return self._contains(key + self._slash)
+        paths = self._paths
+        i = bisect_left(paths, key)
+        return (i < len(paths) and paths[i] == key or
+                self._contains(key + self._slash))
+
+    def isdir(self, path):
+        key = self._key(path)
+        if not key or key == self._slash:
+            return True
+        return self._contains(key + self._slash)
+
+    def islink(self, path):
+        return False
+
+    def stat(self, path):
+        raise OSError(errno.ENOTSUP, 'Indexed paths have no stat', path)
+
+    def lstat(self, path):
+        # There are no links.
+        return self.stat(path)
+
+    def _native_fs(self):
+        return False
+
+    def _contains(self, prefix):
+        """Whether any path is ``prefix``, or starts with it."""
+        paths = self._paths
+        i = bisect_left(paths, prefix)
+        return i < len(paths) and paths[i].startswith(prefix)
+
+    def _key(self, path):
+        """``path`` in the form of the paths in the list."""
+        slash = self._slash
+        if os.sep != '/':
+            sep = os.sep.encode('ASCII') if isinstance(slash, bytes) else os.sep
+            path = path.replace(sep, slash)
+        dot = b'.' if isinstance(slash, bytes) else u'.'
+        while path[:2] == dot + slash:
+            path = path[2:]
+        if path == dot:
+            return path[:0]
+        if len(path) > 1 and path[-1:] == slash:
+            path = path[:-1]
+        return path
+
+    def _prefix(self, path):
+        """What the paths in directory ``path`` start with."""
+        key = self._key(path)
+        if not key or key == self._slash:
+            return key
+        return key + self._slash
@@ -0,0 +1,249 @@
+"""Globbers which search many directories at the same time."""
+
+from __future__ import absolute_import
+
+from collections import deque
+from heapq import heapify, heappop, heappush
+import itertools
+import multiprocessing
+import os
+import pickle
+
+try:
+    from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                    wait, FIRST_COMPLETED)
+except ImportError:
+    ThreadPoolExecutor = ProcessPoolExecutor = None
+
+from .impl import Globber, _Frontier, _StaticEntry
+
+
+__all__ = ('ParallelGlobber', 'ShardedGlobber')
+
+
+class ParallelGlobber(Globber):
+    """Reads up to ``workers`` directories at the same time, on a pool of
+    threads. This pays off where every directory listing means waiting
+    on a network round trip: NFS or FUSE mounts, or a custom globber
+    whose ``listdir``/``scandir`` calls a remote API (which therefore
+    needs to be thread-safe). To use it for the latter, derive from both,
+    this class first; keyword arguments other than those below are
+    passed on to the other class.
+
+    Matches are yielded as soon as their directory has been read, so the
+    order differs from run to run. Pass ``ordered=True`` to get exactly
+    the order a plain :class:`Globber` would produce; directories are
+    still read ahead in parallel, but results are held back until it
+    is their turn.
+
+    When you stop iterating over the results early, directories not
+    being read yet are not read at all.
+    """
+
+    def __init__(self, workers=16, ordered=False, **kwargs):
+        if ThreadPoolExecutor is None:
+            raise ImportError('ParallelGlobber requires concurrent.futures '
+                              '(the "futures" backport on Python 2)')
+        super(ParallelGlobber, self).__init__(**kwargs)
+        self.workers = workers
+        self.ordered = ordered
+
+    def _iter_steps(self, program):
+        if self.workers <= 1:
+            for results in Globber._iter_steps(self, program):
+                yield results
+            return
+
+        executor = ThreadPoolExecutor(self.workers)
+        # Enough work in flight to keep all workers busy, but not so much
+        # as to read far more of the tree than the consumer asks for.
+        window = 2 * self.workers
+        futures = []
+        try:
+            if program.sort:
+                steps = self._sorted_steps(executor, program, window, futures)
+            elif self.ordered:
+                steps = self._ordered_steps(executor, program, window, futures)
+            else:
+                steps = self._unordered_steps(executor, program, window, futures)
+            for results in steps:
+                yield results
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _ordered_steps(self, executor, program, window, futures):
+        """Walk the tree in the same order as :meth:`Globber._iter_steps`
+        does, but start reading the next few directories on the stack
+        ahead of time.
+        """
+        stack = [[node, None] for node in reversed(program.roots)]
+        while stack:
+            for item in stack[-window:]:
+                if item[1] is None:
+                    item[1] = executor.submit(self._step, program, item[0])
+                    futures.append(item[1])
+            node, future = stack.pop()
+            futures.remove(future)
+            results, children = future.result()
+            if results:
+                yield results
+            stack.extend([child, None] for child in reversed(children))
+
+    def _sorted_steps(self, executor, program, window, futures):
+        """Return the matches in sorted order, like :meth:`Globber._iter_steps`
+        does, but start reading the first few directories still to be
+        searched (in that order) ahead of time.
+        """
+        frontier = _Frontier(program)
+        count = itertools.count()
+        unread = [(frontier.key(node), next(count), node) for node in program.roots]
+        heapify(unread)
+        # Nodes being read ahead, and (mapping to None) those read
+        # without, which are still on the unread heap.
+        started = {}
+        while True:
+            while unread and len(futures) < window:
+                node = heappop(unread)[2]
+                if node in started:
+                    del started[node]
+                    continue
+                started[node] = executor.submit(self._step, program, node)
+                futures.append(started[node])
+            results, node = frontier.pop()
+            if results:
+                yield results
+            if node is None:
+                return
+            future = started.pop(node, None)
+            if future is None:
+                future = executor.submit(self._step, program, node)
+                futures.append(future)
+                started[node] = None
+            results, children = future.result()
+            futures.remove(future)
+            frontier.add(results, children)
+            for child in children:
+                heappush(unread, (frontier.key(child), next(count), child))
+
+    def _unordered_steps(self, executor, program, window, futures):
+        """Yield the results of whichever directory is read first."""
+        stack = list(reversed(program.roots))
+        while stack or futures:
+            while stack and len(futures) < window:
+                futures.append(executor.submit(self._step, program, stack.pop()))
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                results, children = future.result()
+                stack.extend(reversed(children))
+                if results:
+                    yield results
+
+
+class ShardedGlobber(Globber):
+    """Splits the tree into shards, which are searched by a pool of
+    ``processes`` (one per CPU by default). This is for trees so large
+    that matching the names, rather than reading the directories, keeps
+    a single core busy.
+
+    The top levels of the tree are read right away, until there are
+    enough directories to give every process a few. Each process then
+    searches below the directories it is given, and sends back what it
+    found in batches of up to about ``batch_size`` matches, together with
+    the directories it did not get to yet; those are handed out again,
+    split up if some processes are idle, so that a lopsided tree does
+    not end up being searched by a single process.
+
+    Matches are yielded in no particular order. The globber and the
+    options are pickled to be sent to the processes, so a custom globber
+    deriving from this one needs to be defined at the top level of a
+    module, and so does a ``predicate``. Where they cannot be pickled
+    (a lambda, say), the search runs in a single process. Keyword
+    arguments other than those below are passed on to the other classes
+    a custom globber derives from, as for :class:`ParallelGlobber`.
+    """
+
+    def __init__(self, processes=None, batch_size=1000, **kwargs):
+        if ProcessPoolExecutor is None:
+            raise ImportError('ShardedGlobber requires concurrent.futures '
+                              '(the "futures" backport on Python 2)')
+        super(ShardedGlobber, self).__init__(**kwargs)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+
+    def _iter_steps(self, program):
+        # Sorting needs the directories searched in order, one by one.
+        if (self.processes <= 1 or program.sort or
+                not _picklable((self, program))):
+            for results in Globber._iter_steps(self, program):
+                yield results
+            return
+
+        # Breadth first, so that the shards are about the same depth.
+        shards = deque(program.roots)
+        while shards and len(shards) < 4 * self.processes:
+            results, children = self._step(program, shards.popleft())
+            if results:
+                yield results
+            shards.extend(children)
+        if not shards:
+            return
+
+        executor = ProcessPoolExecutor(self.processes)
+        pending = [[node] for node in shards]
+        futures = set()
+        try:
+            while pending or futures:
+                while pending:
+                    futures.add(executor.submit(_search_shard, self, program,
+                                                pending.pop(), self.batch_size))
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results, stack = future.result()
+                    if len(stack) > 1 and len(futures) + len(pending) < self.processes:
+                        pending.extend([stack[::2], stack[1::2]])
+                    elif stack:
+                        pending.append(stack)
+                    if results:
+                        yield results
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+def _search_shard(globber, program, stack, limit):
+    """Run in a worker process of :class:`ShardedGlobber`: search depth
+    first from the nodes on ``stack``, until ``limit`` matches have been
+    found or as many directories read. Returns the matches, and the
+    nodes left on the stack.
+    """
+    results = []
+    steps = 0
+    while stack and len(results) < limit and steps < limit:
+        found, children = globber._step(program, stack.pop())
+        results.extend((path, owner, groups, _detached(entry))
+                       for path, owner, groups, entry in found)
+        stack.extend(reversed(children))
+        steps += 1
+    return results, stack
+
+
+def _picklable(obj):
+    try:
+        pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+    return True
+
+
+def _detached(entry):
+    """A copy of directory ``entry`` which can be sent back from a worker
+    process (unlike an ``os.DirEntry``), knowing its type.
+    """
+    if entry is None or entry.__class__ is _StaticEntry:
+        return entry
+    return _StaticEntry(os.path.dirname(entry.path), entry.name,
+                        entry.is_dir(), entry.is_symlink())
@@ -0,0 +1,193 @@
+"""A globber which keeps statistics on where the time goes."""
+
+from __future__ import absolute_import
+
+import time
+from threading import Lock, local
+
+from . import fnmatch
+from .impl import Globber
+
+
+__all__ = ('InstrumentedGlobber', 'GlobStats')
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+_FS_CALLS = ('scandir', 'listdir', 'exists', 'isdir', 'islink', 'stat',
+             'read_ignore_file')
+
+
+class GlobStats(object):
+    """Statistics collected by :class:`InstrumentedGlobber`:
+
+    ``calls``, ``times``
+        The number of calls made to each filesystem method, and the
+        seconds spent in them, by method name.
+    ``directories``
+        The number of directories searched.
+    ``entries_listed``, ``entries_matched``, ``entries_rejected``
+        Of the entries of these directories, how many were read, how
+        many matched, and how many were passed over (neither matched,
+        nor searched further).
+    ``match_time``
+        The seconds spent searching directories, other than in
+        filesystem calls; mostly, that is matching names.
+    ``pattern_cache_hits``, ``pattern_cache_misses``
+        The lookups of compiled patterns, from the caches of
+        :mod:`glob2.fnmatch`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Set all statistics back to zero."""
+        self.calls = dict((name, 0) for name in _FS_CALLS)
+        self.times = dict((name, 0.0) for name in _FS_CALLS)
+        self.directories = 0
+        self.entries_listed = 0
+        self.entries_matched = 0
+        self.entries_rejected = 0
+        self.match_time = 0.0
+        self.pattern_cache_hits = 0
+        self.pattern_cache_misses = 0
+
+    def as_dict(self):
+        """Return a snapshot of the statistics, as a dict."""
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'times': dict(self.times),
+                'directories': self.directories,
+                'entries_listed': self.entries_listed,
+                'entries_matched': self.entries_matched,
+                'entries_rejected': self.entries_rejected,
+                'match_time': self.match_time,
+                'pattern_cache_hits': self.pattern_cache_hits,
+                'pattern_cache_misses': self.pattern_cache_misses,
+            }
+
+    def __repr__(self):
+        return '<GlobStats %r>' % (self.as_dict(),)
+
+
+class InstrumentedGlobber(Globber):
+    """Counts and times the calls to the filesystem methods, as well
+    as what happens in every directory searched, into :attr:`stats`
+    (a :class:`GlobStats`).
+
+    To instrument a custom or caching globber, derive from both, this
+    class first. For every filesystem call, ``on_call(method, path,
+    seconds)`` is called; for every directory searched,
+    ``on_directory(path, seconds, listed, matched, rejected)``; these
+    may pass the numbers on to a metrics system.
+
+    Any other keyword arguments are passed on to the next class, so
+    that with :class:`ParallelGlobber`, say, ``workers`` may be given
+    as well. This works along with it, but not with
+    :class:`ShardedGlobber`, which searches in other processes.
+    """
+
+    _wraps_fs = True
+
+    def __init__(self, on_call=None, on_directory=None, **kwargs):
+        super(InstrumentedGlobber, self).__init__(**kwargs)
+        self.stats = GlobStats()
+        self.on_call = on_call
+        self.on_directory = on_directory
+        self._local = local()
+
+    def scandir(self, path):
+        return self._timed('scandir', path, super(InstrumentedGlobber, self).scandir)
+
+    def listdir(self, path):
+        return self._timed('listdir', path, super(InstrumentedGlobber, self).listdir)
+
+    def exists(self, path):
+        return self._timed('exists', path, super(InstrumentedGlobber, self).exists)
+
+    def isdir(self, path):
+        return self._timed('isdir', path, super(InstrumentedGlobber, self).isdir)
+
+    def islink(self, path):
+        return self._timed('islink', path, super(InstrumentedGlobber, self).islink)
+
+    def stat(self, path):
+        return self._timed('stat', path, super(InstrumentedGlobber, self).stat)
+
+    def read_ignore_file(self, path):
+        return self._timed('read_ignore_file', path,
+                           super(InstrumentedGlobber, self).read_ignore_file)
+
+    def _timed(self, method, path, func):
+        step = getattr(self._local, 'step', None)
+        # A call made from within another one (scandir() of a custom
+        # globber calling listdir(), say) is counted, but its time not
+        # taken off the directory's twice.
+        outermost = step is not None and not step[2]
+        if outermost:
+            step[2] = True
+        start = _clock()
+        try:
+            result = func(path)
+            if method == 'scandir':
+                result = list(result)
+                if step is not None:
+                    step[1] += len(result)
+            return result
+        finally:
+            elapsed = _clock() - start
+            if outermost:
+                step[0] += elapsed
+                step[2] = False
+            with self.stats._lock:
+                self.stats.calls[method] = self.stats.calls.get(method, 0) + 1
+                self.stats.times[method] = self.stats.times.get(method, 0.0) + elapsed
+            if self.on_call is not None:
+                self.on_call(method, path, elapsed)
+
+    def _iter_steps(self, program):
+        before = _pattern_cache_info()
+        try:
+            for results in super(InstrumentedGlobber, self)._iter_steps(program):
+                yield results
+        finally:
+            hits, misses = _pattern_cache_info()
+            with self.stats._lock:
+                self.stats.pattern_cache_hits += hits - before[0]
+                self.stats.pattern_cache_misses += misses - before[1]
+
+    def _step(self, program, node):
+        # Time spent in filesystem calls, entries listed, and whether a
+        # filesystem call is in progress.
+        step = self._local.step = [0.0, 0, False]
+        start = _clock()
+        try:
+            results, children = super(InstrumentedGlobber, self)._step(program, node)
+        finally:
+            self._local.step = None
+        elapsed = _clock() - start
+
+        matched = set(result[0] for result in results)
+        passed = matched.union(child.path for child in children)
+        rejected = max(step[1] - len(passed), 0)
+        with self.stats._lock:
+            self.stats.directories += 1
+            self.stats.entries_listed += step[1]
+            self.stats.entries_matched += len(matched)
+            self.stats.entries_rejected += rejected
+            self.stats.match_time += elapsed - step[0]
+        if self.on_directory is not None:
+            self.on_directory(node.path, elapsed, step[1], len(matched), rejected)
+        return results, children
+
+
+def _pattern_cache_info():
+    hits = misses = 0
+    for cached in (fnmatch._compile_pattern, fnmatch._simple_shape):
+        info = cached.cache_info()
+        hits += info.hits
+        misses += info.misses
+    return hits, misses
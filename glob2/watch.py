@@ -0,0 +1,340 @@
+"""Keeping the matches of a pattern up to date as the filesystem changes,
+through inotify; Linux only.
+"""
+
+from __future__ import absolute_import
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+from .impl import Globber, _curdir, _fsdecode, _fsencode, _join_paths
+
+
+__all__ = ('GlobWatcher', 'GlobEvent', 'watch')
+
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+
+# What changes the names in a directory; and what may change whether a
+# file meets the type, size and time options.
+_NAMES_MASK = _IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO
+_CONTENTS_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE
+
+_EVENT = struct.Struct('iIII')           # wd, mask, cookie, length of name
+_MISSING = object()
+
+
+class GlobEvent(object):
+    """A path which started (``kind`` is ``'added'``) or stopped
+    (``'removed'``) matching the pattern of a :class:`GlobWatcher`, with
+    the ``groups`` its wildcards match(ed).
+    """
+
+    __slots__ = ('kind', 'path', 'groups')
+
+    def __init__(self, kind, path, groups):
+        self.kind = kind
+        self.path = path
+        self.groups = groups
+
+    def __eq__(self, other):
+        return (isinstance(other, GlobEvent) and
+                (self.kind, self.path, self.groups) ==
+                (other.kind, other.path, other.groups))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<%s %s %r %r>' % (self.__class__.__name__, self.kind,
+                                  self.path, self.groups)
+
+
+class GlobWatcher(object):
+    """Searches for ``pathname`` once, then follows the changes to the
+    tree through inotify, to keep ``matches`` (a dict of every matching
+    path to its groups) up to date, and report what changed.
+
+    Only the directories the search reads or goes through are watched:
+    those that may still hold a match. When something changes in one of
+    them, only that directory is searched again, and those that appeared
+    in it; the directories that disappeared are forgotten.
+
+    The options are those of :meth:`Globber.compile`; with ``type``,
+    sizes or times, changes to the contents of files are followed, too.
+    The search goes through ``globber`` (on the local filesystem), or a
+    plain :class:`Globber`.
+
+    Call :meth:`read` to wait for changes, or iterate over the watcher to
+    get them as they come; :meth:`fileno` allows waiting for them in an
+    event loop instead. Close the watcher when done, or use it as a
+    context manager.
+    """
+
+    def __init__(self, pathname, globber=None, **options):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'GlobWatcher requires inotify (Linux)')
+        self.globber = globber or Globber()
+        self.pattern = self.globber.compile(pathname, **options)
+        self._program = self.pattern._program
+        self._mask = _NAMES_MASK | _IN_ONLYDIR
+        if self._program.criteria is not None:
+            self._mask |= _CONTENTS_MASK
+        self._bytes = isinstance(pathname, bytes) and not isinstance(pathname, str)
+
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            _raise_errno()
+        self.matches = {}
+        # Directory path -> (node, its matches, the paths of its
+        # subdirectories being searched); and the inotify watches.
+        self._nodes = {}
+        self._wd_paths = {}
+        self._path_wd = {}
+        self._changes = {}
+        for root in self._program.roots:
+            self._search(root)
+        self._changes = {}
+
+    def fileno(self):
+        return self._fd
+
+    def read(self, timeout=None):
+        """Wait up to ``timeout`` seconds (forever if None) for changes,
+        and return them as a list of :class:`GlobEvent`, the removed
+        paths first; an empty one if nothing changed in time.
+        """
+        if self._fd is None:
+            raise ValueError('read from a closed GlobWatcher')
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        # Whatever comes in one go is dealt with together, so that a
+        # directory is searched once for many changes in it.
+        touched = {}
+        overflow = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as err:
+                if err.errno == errno.EAGAIN:
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & _IN_IGNORED:
+                    self._forget(wd)
+                elif wd in self._wd_paths:
+                    if not self._bytes:
+                        name = _fsdecode(name)
+                    touched.setdefault(wd, set()).add(name)
+        if overflow:
+            self._rescan()
+        else:
+            for wd, names in touched.items():
+                for path in list(self._wd_paths.get(wd, ())):
+                    self._refresh(path, names)
+        return self._flush()
+
+    def __iter__(self):
+        while self._fd is not None:
+            for event in self.read():
+                yield event
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _search(self, top):
+        """Search from node ``top`` down, watching every directory."""
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            # Watch before reading, so that no change goes unnoticed.
+            self._watch(node.path)
+            results, children = self.globber._step(self._program, node)
+            paths = []
+            for path, _, groups, _ in results:
+                if path not in paths:
+                    paths.append(path)
+                    self._set(path, groups)
+            self._nodes[node.path] = (node, paths,
+                                      [child.path for child in children])
+            stack.extend(reversed(children))
+
+    def _drop(self, top):
+        """Forget the directory ``top`` and all below it."""
+        stack = [top]
+        while stack:
+            found = self._nodes.pop(stack.pop(), None)
+            if found is None:
+                continue
+            node, paths, children = found
+            self._unwatch(node.path)
+            for path in paths:
+                self._set(path, _MISSING)
+            stack.extend(children)
+
+    def _refresh(self, path, names):
+        """Search directory ``path`` again, after ``names`` in it
+        changed, along with the subdirectories of those names; the other
+        subdirectories are kept as they are.
+        """
+        found = self._nodes.get(path)
+        if found is None:
+            return
+        node, old_paths, old_children = found
+        sep = self._program.sep
+        changed = set(_join_paths([path, name], sep=sep) for name in names)
+        if self._program.gitignore and ('.gitignore' in names or
+                                        b'.gitignore' in names):
+            # The rules for everything below have changed.
+            changed.update(old_children)
+
+        results, children = self.globber._step(self._program, node)
+        paths = []
+        for target, _, groups, _ in results:
+            if target not in paths:
+                paths.append(target)
+                self._set(target, groups)
+        for target in old_paths:
+            if target not in paths:
+                self._set(target, _MISSING)
+        child_paths = [child.path for child in children]
+        self._nodes[path] = (node, paths, child_paths)
+
+        # Dropping a subtree and searching it again only reports what
+        # actually changed in it, see _flush().
+        for child in old_children:
+            if child in changed or child not in child_paths:
+                self._drop(child)
+        for child in children:
+            if child.path not in self._nodes:
+                self._search(child)
+
+    def _rescan(self):
+        """Start over, after inotify lost track of some changes."""
+        for wd in list(self._wd_paths):
+            self._libc.inotify_rm_watch(self._fd, wd)
+        self._wd_paths = {}
+        self._path_wd = {}
+        self._nodes = {}
+        for path in list(self.matches):
+            self._set(path, _MISSING)
+        for root in self._program.roots:
+            self._search(root)
+
+    def _set(self, path, groups):
+        """Record that ``path`` now matches with ``groups``, or no longer
+        matches (``_MISSING``), remembering how it was before.
+        """
+        if path not in self._changes:
+            self._changes[path] = self.matches.get(path, _MISSING)
+        if groups is _MISSING:
+            self.matches.pop(path, None)
+        else:
+            self.matches[path] = groups
+
+    def _flush(self):
+        """The events for the changes recorded since the last time."""
+        removed = []
+        added = []
+        for path, before in self._changes.items():
+            after = self.matches.get(path, _MISSING)
+            if before is not _MISSING and after is _MISSING:
+                removed.append(GlobEvent('removed', path, before))
+            elif before is _MISSING and after is not _MISSING:
+                added.append(GlobEvent('added', path, after))
+            elif before != after:
+                removed.append(GlobEvent('removed', path, before))
+                added.append(GlobEvent('added', path, after))
+        self._changes = {}
+        return removed + added
+
+    def _watch(self, path):
+        if path in self._path_wd:
+            return
+        wd = self._libc.inotify_add_watch(
+            self._fd, _fsencode(path or _curdir(path)), self._mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOSPC, errno.ENOMEM):
+                # Out of watches: see /proc/sys/fs/inotify/max_user_watches.
+                _raise_errno(path)
+            # Gone already, or not a directory; its parent tells when
+            # that changes.
+            return
+        self._path_wd[path] = wd
+        self._wd_paths.setdefault(wd, set()).add(path)
+
+    def _unwatch(self, path):
+        wd = self._path_wd.pop(path, None)
+        if wd is None:
+            return
+        paths = self._wd_paths[wd]
+        paths.discard(path)
+        if not paths:
+            del self._wd_paths[wd]
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _forget(self, wd):
+        """The kernel dropped watch ``wd``: its directory is gone."""
+        for path in self._wd_paths.pop(wd, ()):
+            if self._path_wd.get(path) == wd:
+                del self._path_wd[path]
+
+
+def watch(pathname, globber=None, **options):
+    """Return a :class:`GlobWatcher` for ``pathname``."""
+    return GlobWatcher(pathname, globber, **options)
+
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def _raise_errno(path=None):
+    err = ctypes.get_errno()
+    raise OSError(err, os.strerror(err), path)
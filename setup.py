@@ -38,5 +38,5 @@ setup(
         'Programming Language :: Python :: 3',
         'Topic :: Software Development :: Libraries',
         ],
-    packages = find_packages()
+    packages = find_packages(exclude=['benchmarks', 'benchmarks.*'])
 )
@@ -1,6 +1,8 @@
+import copy
 import os
 from os import path
 import shutil
+import sys
 import tempfile
 
 import glob2
@@ -43,6 +45,30 @@ class TestFnmatch(object):
             ('fooC', ('C',)),
         ]
 
+    def test_simple_shapes(self):
+        names = ['ab', 'aba', 'abab', 'b', '']
+        assert fnmatch.filter(names, 'ab*ab') == [('abab', ('',))]
+        assert fnmatch.filter(names, 'ab*') == [
+            ('ab', ('',)), ('aba', ('a',)), ('abab', ('ab',))]
+        assert fnmatch.filter(names, '*b') == [
+            ('ab', ('a',)), ('abab', ('aba',)), ('b', ('',))]
+        assert fnmatch.filter(names, '*') == [(n, (n,)) for n in names]
+        assert fnmatch.filter(names, 'aba') == [('aba', ())]
+        assert fnmatch.filter(names, 'AB*', case_sensitive=False) == [
+            ('ab', ('',)), ('aba', ('a',)), ('abab', ('ab',))]
+        assert fnmatch.fnmatchcase('aba', 'aba')
+        assert not fnmatch.fnmatchcase('ab', 'aba')
+
+    def test_norm_paths(self):
+        names = ['a/b', 'a|c', 'b/a']
+        assert fnmatch.filter(names, 'a|*', norm_paths=None, sep='|') == [
+            ('a/b', ('b',)),
+            ('a|c', ('c',)),
+        ]
+        assert fnmatch.filter(names, 'a|*', norm_paths=False) == [
+            ('a|c', ('c',)),
+        ]
+
 
 class BaseTest(object):
 
@@ -68,6 +94,16 @@ class BaseTest(object):
         for name in names:
             open(path.join(self.basedir, name), 'w').close()
 
+    def recording_globber(self):
+        # Records the directories it reads in self.listed.
+        self.listed = listed = []
+
+        class RecordingGlobber(glob2.Globber):
+            def scandir(self, path):
+                listed.append(path)
+                return glob2.Globber.scandir(self, path)
+        return RecordingGlobber()
+
 
 class TestPatterns(BaseTest):
 
@@ -172,3 +208,1182 @@ class TestIncludeHidden(BaseTest):
             ('b/.bar', ('b', '.bar')),
             ('b/py', ('b', 'py')),
         ]
+
+
+class TestStreaming(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a', 'a/b', 'a/b/c', 'd')
+        self.touch('a/x.py', 'a/b/y.py', 'a/b/c/z.py', 'd/w.py')
+
+    def test_globstar_is_lazy(self):
+        results = self.recording_globber().iglob('**')
+        first = next(results)
+        assert first in ('a', 'd')
+        # Only the root directory has been read so far
+        assert self.listed == ['.']
+        assert sorted([first] + list(results)) == [
+            'a', 'a/b', 'a/b/c', 'a/b/c/z.py', 'a/b/y.py', 'a/x.py',
+            'd', 'd/w.py']
+
+
+class TestScandir(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a', 'a/foo', 'b')
+        self.touch('a/bar.py', 'a/foo/hello.py', 'b/py', 'file.py')
+
+    def test_no_stat_per_entry(self):
+        # The default globber gets file types from the directory listing
+        checked = []
+        old_stat, old_lstat = os.stat, os.lstat
+
+        def stat(path, *args, **kwargs):
+            checked.append(path)
+            return old_stat(path, *args, **kwargs)
+
+        def lstat(path, *args, **kwargs):
+            checked.append(path)
+            return old_lstat(path, *args, **kwargs)
+
+        os.stat, os.lstat = stat, lstat
+        try:
+            assert sorted(glob2.glob('**/*.py')) == [
+                'a/bar.py', 'a/foo/hello.py', 'file.py']
+            assert sorted(glob2.glob('*/')) == ['a/', 'b/']
+        finally:
+            os.stat, os.lstat = old_stat, old_lstat
+        assert checked == []
+
+    def test_custom_listdir_fallback(self):
+        class ListdirGlobber(glob2.Globber):
+            def listdir(self, path):
+                return os.listdir(path)
+
+        globber = ListdirGlobber()
+        assert not globber._native_fs()
+        entries = globber.scandir('a')
+        assert sorted(e.name for e in entries) == ['bar.py', 'foo']
+        assert sorted(globber.glob('**/*.py')) == [
+            'a/bar.py', 'a/foo/hello.py', 'file.py']
+        assert sorted(globber.glob('**/')) == ['a/', 'a/foo/', 'b/']
+
+
+class TestSinglePass(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('src', 'src/tests', 'src/pkg', 'src/pkg/tests', 'docs')
+        self.touch('src/tests/test_a.py', 'src/pkg/tests/test_b.py',
+                   'src/pkg/tests/helper.py', 'src/pkg/mod.py', 'docs/x.py')
+
+    def test_each_directory_read_once(self):
+        globber = self.recording_globber()
+        assert sorted(globber.glob('src/**/tests/test_*.py', True)) == [
+            ('src/pkg/tests/test_b.py', ('pkg', 'b')),
+            ('src/tests/test_a.py', ('', 'a')),
+        ]
+        assert sorted(self.listed) == [
+            'src', 'src/pkg', 'src/pkg/tests', 'src/tests']
+
+    def test_literal_tail_not_listed(self):
+        globber = self.recording_globber()
+        assert sorted(globber.glob('*/pkg/tests/test_b.py', True)) == [
+            ('src/pkg/tests/test_b.py', ('src',)),
+        ]
+        assert self.listed == ['.']
+
+    def test_only_matching_directories_read(self):
+        globber = self.recording_globber()
+        assert sorted(globber.glob('s*/p*/*.py')) == ['src/pkg/mod.py']
+        assert self.listed == ['.', 'src', 'src/pkg']
+
+
+class TestGlobMany(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a', 'conf', 'conf/sub')
+        self.touch('x.py', 'x.pyi', 'a/y.py', 'conf/c.yaml', 'conf/sub/d.yaml',
+                   'conf/sub/e.py')
+
+    def test_shared_traversal(self):
+        patterns = ['**/*.py', '**/*.pyi', 'conf/**/*.yaml', 'conf/sub/e.py']
+        result = self.recording_globber().glob_many(patterns)
+        assert sorted(result) == [
+            ('a/y.py', ('**/*.py',)),
+            ('conf/c.yaml', ('conf/**/*.yaml',)),
+            ('conf/sub/d.yaml', ('conf/**/*.yaml',)),
+            ('conf/sub/e.py', ('**/*.py', 'conf/sub/e.py')),
+            ('x.py', ('**/*.py',)),
+            ('x.pyi', ('**/*.pyi',)),
+        ]
+        assert sorted(self.listed) == ['.', 'a', 'conf', 'conf/sub']
+
+    def test_with_matches(self):
+        result = glob2.glob_many(['*/*.py', 'a/*'], with_matches=True)
+        assert result == [
+            ('a/y.py', (('*/*.py', ('a', 'y')), ('a/*', ('y.py',)))),
+        ]
+
+
+class TestResolvePattern(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a', 'a/b')
+        self.touch('a/x.py')
+
+    def test(self):
+        globber = glob2.Globber()
+        args = (False, False, True, True, None)
+        assert globber.resolve_pattern('a', '*.py', *args) == [('x.py', ('x',))]
+        assert globber.resolve_pattern('a', '', *args) == [('', ())]
+        assert globber.resolve_pattern('a/x.py', '', *args) == []
+
+
+class TestExclude(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('src', 'src/__pycache__', 'build',
+                      'docs', 'docs/_build', 'docs/api')
+        self.touch('src/a.py', 'src/__pycache__/a.py', 'build/gen.py',
+                   'src/build', 'docs/_build/x.py', 'docs/api/y.py', 'c.pyc')
+
+    def test_exclude_names(self):
+        globber = self.recording_globber()
+        assert sorted(globber.glob('**/*', exclude=['__pycache__', 'build/'])) == [
+            'c.pyc', 'docs', 'docs/_build', 'docs/_build/x.py', 'docs/api',
+            'docs/api/y.py', 'src', 'src/a.py', 'src/build']
+        assert 'build' not in self.listed
+        assert 'src/__pycache__' not in self.listed
+
+    def test_exclude_path(self):
+        globber = self.recording_globber()
+        assert sorted(globber.glob('docs/**/*.py', exclude='docs/_build')) == [
+            'docs/api/y.py']
+        assert 'docs/_build' not in self.listed
+
+    def test_literal_segment_excluded(self):
+        assert glob2.glob('src/__pycache__/*.py', exclude='__pycache__') == []
+
+    def test_literal_path_excluded(self):
+        assert glob2.glob('src/a.py', exclude='*.py') == []
+        assert glob2.glob('src/a.py', exclude='src') == []
+        assert glob2.glob('src/a.py', exclude='docs') == ['src/a.py']
+        assert glob2.glob('c.pyc', gitignore=True) == ['c.pyc']
+        with open('.gitignore', 'w') as f:
+            f.write('*.pyc\n')
+        assert glob2.glob('c.pyc', gitignore=True) == []
+
+    def test_gitignore(self):
+        with open('.gitignore', 'w') as f:
+            f.write('# build output\n*.pyc\nbuild/\n')
+        with open('docs/.gitignore', 'w') as f:
+            f.write('/_build/\n!*.pyc\n')
+        self.touch('docs/keep.pyc')
+        globber = self.recording_globber()
+        assert sorted(globber.glob('**/*.py*', gitignore=True)) == [
+            'docs/api/y.py', 'docs/keep.pyc', 'src/__pycache__/a.py', 'src/a.py']
+        assert 'docs/_build' not in self.listed
+
+    def test_bytes(self):
+        with open('.gitignore', 'w') as f:
+            f.write('*.pyc\nbuild/\n')
+        assert sorted(glob2.glob(b'**/*.py*', gitignore=True)) == [
+            b'docs/_build/x.py', b'docs/api/y.py', b'src/__pycache__/a.py',
+            b'src/a.py']
+        # Exclude patterns are taken as the same type as the pattern.
+        assert sorted(glob2.glob(b'src/**/*.py', exclude=['__pycache__'])) == [
+            b'src/a.py']
+        assert sorted(glob2.glob('src/**/*.py', exclude=[b'__pycache__'])) == [
+            'src/a.py']
+
+
+class TestCachingGlobber(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a', 'a/b')
+        self.touch('a/x.py', 'a/b/y.py')
+
+    def test_cached(self):
+        globber = glob2.CachingGlobber()
+        assert sorted(globber.glob('**/*.py')) == ['a/b/y.py', 'a/x.py']
+        misses = globber.cache_info().misses
+        self.touch('a/z.py')
+        assert sorted(globber.glob('**/*.py')) == ['a/b/y.py', 'a/x.py']
+        assert globber.cache_info().misses == misses
+        assert globber.cache_info().hits > 0
+
+        globber.invalidate('a/z.py')
+        assert sorted(globber.glob('**/*.py')) == ['a/b/y.py', 'a/x.py', 'a/z.py']
+
+    def test_invalidate_current_directory(self):
+        globber = glob2.CachingGlobber()
+        assert globber.glob('*.py') == []
+        self.touch('n.py')
+        assert globber.glob('*.py') == []
+        globber.invalidate('n.py')
+        assert globber.glob('*.py') == ['n.py']
+
+    def test_invalidate_spellings(self):
+        globber = glob2.CachingGlobber()
+        assert sorted(globber.glob('**/*.py')) == ['a/b/y.py', 'a/x.py']
+        self.touch('a/b/z.py')
+        globber.invalidate('.', recursive=True)
+        assert sorted(globber.glob('**/*.py')) == [
+            'a/b/y.py', 'a/b/z.py', 'a/x.py']
+
+        self.touch('a/b/w.py')
+        globber.invalidate('./a/b/w.py')
+        assert 'a/b/w.py' in globber.glob('a/b/*.py')
+        self.touch('a/v.py')
+        globber.invalidate(os.path.abspath('a'))
+        assert 'a/v.py' in globber.glob('a/*.py')
+
+    def test_mixin(self):
+        class StorageGlobber(glob2.Globber):
+            def __init__(self, storage):
+                self.storage = storage
+
+            def listdir(self, path):
+                return self.storage[path]
+
+        class CachingStorageGlobber(glob2.CachingGlobber, StorageGlobber):
+            pass
+
+        globber = CachingStorageGlobber(storage={'.': ['a', 'b']}, ttl=5)
+        assert globber.glob('*') == ['a', 'b']
+        assert globber.glob('*') == ['a', 'b']
+        assert globber.cache_info().hits == 1 and globber.ttl == 5
+
+        class CachingParallelGlobber(glob2.CachingGlobber, glob2.ParallelGlobber):
+            pass
+
+        globber = CachingParallelGlobber(workers=2, maxsize=100)
+        assert sorted(globber.glob('**/*.py')) == ['a/b/y.py', 'a/x.py']
+
+    def test_sizes_not_cached(self):
+        # Only listings are cached: sizes and times are looked up afresh.
+        globber = glob2.CachingGlobber()
+        assert globber.glob('a/*.py', min_size=1) == []
+        with open('a/x.py', 'w') as f:
+            f.write('x' * 100)
+        assert globber.glob('a/*.py', min_size=1) == ['a/x.py']
+        assert globber.glob('a/*.py', with_stat=True)[0].size == 100
+
+    def test_missing_directory_cached(self):
+        globber = glob2.CachingGlobber()
+        assert globber.glob('missing/*') == []
+        assert globber.glob('missing/*') == []
+        assert globber.cache_info().hits == 1
+
+    def test_ttl(self):
+        globber = glob2.CachingGlobber(ttl=0)
+        assert globber.glob('a/*.py') == ['a/x.py']
+        self.touch('a/z.py')
+        assert sorted(globber.glob('a/*.py')) == ['a/x.py', 'a/z.py']
+
+    def test_revalidate(self):
+        globber = glob2.CachingGlobber(revalidate=True)
+        assert globber.glob('a/*.py') == ['a/x.py']
+        self.touch('a/z.py')
+        os.utime('a', (0, 0))
+        assert sorted(globber.glob('a/*.py')) == ['a/x.py', 'a/z.py']
+
+    def test_eviction(self):
+        globber = glob2.CachingGlobber(maxsize=1)
+        globber.glob('**/*.py')
+        info = globber.cache_info()
+        assert info.currsize == 1
+        assert info.evictions > 0
+
+        globber = glob2.CachingGlobber(maxbytes=1)
+        globber.glob('**/*.py')
+        assert globber.cache_info().currsize == 0
+
+    def test_custom_globber(self):
+        calls = []
+
+        class ListdirGlobber(glob2.Globber):
+            def listdir(self, path):
+                calls.append(path)
+                return os.listdir(path)
+
+        class CachingListdirGlobber(glob2.CachingGlobber, ListdirGlobber):
+            pass
+
+        globber = CachingListdirGlobber()
+        assert globber.glob('a/*.py') == ['a/x.py']
+        assert globber.glob('a/*.py') == ['a/x.py']
+        assert calls == ['a']
+
+
+class TestPersistentIndex(BaseTest):
+
+    def teardown(self):
+        BaseTest.teardown(self)
+        if path.exists(self.index):
+            os.unlink(self.index)
+
+    def setup_files(self):
+        self.makedirs('a', 'a/b', 'a/.h')
+        self.touch('a/x.py', 'a/b/y.py', 'a/.h/z.py')
+        # Make the listings old enough to be trusted.
+        for name in ('.', 'a', 'a/b', 'a/.h'):
+            os.utime(name, (1000, 1000))
+
+    def test_reuse(self):
+        index = self.index = self.basedir + '.index'
+        with glob2.PersistentIndexGlobber(index) as globber:
+            assert len(globber.glob('**', include_hidden=True)) == 6
+
+        # Now everything can be served from the index
+
+        old_scandir = glob2.impl._scandir
+        glob2.index._scandir = None
+        try:
+            globber = glob2.PersistentIndexGlobber(index)
+            assert sorted(globber.glob('a/*/*.py', True)) == [
+                ('a/b/y.py', ('b', 'y'))]
+            assert sorted(globber.glob('a/**', include_hidden=True)) == [
+                'a/.h', 'a/.h/z.py', 'a/b', 'a/b/y.py', 'a/x.py']
+            assert sorted(globber.glob('*/')) == ['a/']
+        finally:
+            glob2.index._scandir = old_scandir
+            globber.close()
+
+    def test_changed_directory_reread(self):
+        index = self.index = self.basedir + '.index'
+        with glob2.PersistentIndexGlobber(index) as globber:
+            globber.glob('a/**/*.py')
+        self.touch('a/b/new.py')
+        os.utime('a/b', (2000, 2000))
+        with glob2.PersistentIndexGlobber(index) as globber:
+            assert sorted(globber.glob('a/*/*.py')) == [
+                'a/b/new.py', 'a/b/y.py']
+
+    def test_bad_index(self):
+        index = self.index = self.basedir + '.index'
+        with glob2.PersistentIndexGlobber(index) as globber:
+            globber.glob('a/**/*.py')
+        with open(index, 'rb') as f:
+            data = f.read()
+        for bad in (data[:4], b'NOTANIDX' + data[8:], data[:30]):
+            with open(index, 'wb') as f:
+                f.write(bad)
+            with glob2.PersistentIndexGlobber(index) as globber:
+                assert sorted(globber.glob('a/**/*.py')) == [
+                    'a/b/y.py', 'a/x.py']
+        # And the index has been written anew.
+        with open(index, 'rb') as f:
+            assert f.read(8) == data[:8]
+
+    def test_mixin(self):
+        class StorageGlobber(glob2.Globber):
+            def __init__(self, storage):
+                self.storage = storage
+
+        class IndexStorageGlobber(glob2.PersistentIndexGlobber, StorageGlobber):
+            pass
+
+        index = self.index = self.basedir + '.index'
+        globber = IndexStorageGlobber(index, storage='remote')
+        assert globber.storage == 'remote' and globber.index_path == index
+        globber.close()
+
+
+class TestParallelGlobber(BaseTest):
+
+    def setup_files(self):
+        for i in range(10):
+            self.makedirs('d%d' % i, 'd%d/sub' % i)
+            self.touch('d%d/a.py' % i, 'd%d/sub/b.py' % i)
+
+    def make_globber(self, **kwargs):
+        import threading
+        import time
+        self.listed = listed = []
+        self.concurrency = concurrency = [0, 0]
+        lock = threading.Lock()
+
+        class SlowGlobber(glob2.ParallelGlobber):
+            def scandir(self, path):
+                with lock:
+                    listed.append(path)
+                    concurrency[0] += 1
+                    concurrency[1] = max(concurrency)
+                time.sleep(0.01)
+                with lock:
+                    concurrency[0] -= 1
+                return glob2.Globber.scandir(self, path)
+        return SlowGlobber(**kwargs)
+
+    def test_unordered(self):
+        globber = self.make_globber(workers=4)
+        assert sorted(globber.glob('**/*.py', True)) == \
+            sorted(glob2.glob('**/*.py', True))
+        assert self.concurrency[1] > 1
+
+    def test_ordered(self):
+        globber = self.make_globber(workers=4, ordered=True)
+        assert globber.glob('**/*.py', True) == glob2.glob('**/*.py', True)
+        assert self.concurrency[1] > 1
+
+    def test_stop_early(self):
+        globber = self.make_globber(workers=2)
+        results = globber.iglob('**/*.py', with_matches=True)
+        next(results)
+        results.close()
+        count = len(self.listed)
+        assert count < 21
+        import time
+        time.sleep(0.05)
+        assert len(self.listed) == count
+
+    def test_mixin(self):
+        class StorageGlobber(glob2.Globber):
+            def __init__(self, storage):
+                self.storage = storage
+
+            def listdir(self, path):
+                return self.storage[path]
+
+        class ParallelStorageGlobber(glob2.ParallelGlobber, StorageGlobber):
+            pass
+
+        globber = ParallelStorageGlobber(storage={'.': ['a', 'b']}, workers=2)
+        assert sorted(globber.glob('*')) == ['a', 'b']
+        assert globber.workers == 2
+
+
+class TestAsyncGlobber(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('dir', 'dir/sub')
+        self.touch('dir/a.py', 'dir/sub/b.py', 'dir/c.txt')
+
+    def run_async(self, coroutine):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test(self):
+        if not hasattr(glob2, 'AsyncGlobber'):
+            return
+        globber = glob2.AsyncGlobber(concurrency=2)
+        assert sorted(self.run_async(globber.glob('**/*.py', True))) == \
+            sorted(glob2.glob('**/*.py', True))
+        assert self.run_async(globber.glob('dir/c.txt')) == ['dir/c.txt']
+        assert self.run_async(globber.glob('dir/missing')) == []
+
+    def test_custom(self):
+        if not hasattr(glob2, 'AsyncGlobber'):
+            return
+        import asyncio
+        listed = []
+
+        class StorageGlobber(glob2.AsyncGlobber):
+            async def listdir(self, path):
+                listed.append(path)
+                await asyncio.sleep(0)
+                return os.listdir(path)
+
+        globber = StorageGlobber()
+        assert sorted(self.run_async(globber.glob('dir/**/*.py'))) == \
+            sorted(glob2.glob('dir/**/*.py'))
+        assert 'dir/sub' in listed
+
+    def storage_globber(self):
+        # A storage which is nowhere on the local filesystem.
+        import errno
+        import stat
+        sizes = {'store/x.bin': 3, 'store/sub/y.bin': 5}
+        dirs = ['store', 'store/sub']
+
+        class StorageGlobber(glob2.AsyncGlobber):
+            async def listdir(self, path):
+                return sorted(set(p[len(path) + 1:].split('/')[0]
+                                  for p in list(sizes) + dirs
+                                  if p.startswith(path + '/')))
+
+            async def exists(self, path):
+                return path in sizes or path in dirs
+
+            async def isdir(self, path):
+                return path in dirs
+
+            async def islink(self, path):
+                return False
+
+            async def stat(self, path):
+                if path in dirs:
+                    return os.stat_result((stat.S_IFDIR, 0, 0, 1, 0, 0, 0, 0, 0, 0))
+                if path in sizes:
+                    return os.stat_result(
+                        (stat.S_IFREG, 0, 0, 1, 0, 0, sizes[path], 0, 0, 0))
+                raise OSError(errno.ENOENT, 'No such file', path)
+
+        return StorageGlobber()
+
+    def test_custom_with_stat(self):
+        if not hasattr(glob2, 'AsyncGlobber'):
+            return
+        globber = self.storage_globber()
+        results = self.run_async(globber.glob('store/**', with_stat=True))
+        assert sorted((r.path, r.is_dir(), r.is_file(), r.size)
+                      for r in results) == [
+            ('store/sub', True, False, 0),
+            ('store/sub/y.bin', False, True, 5),
+            ('store/x.bin', False, True, 3)]
+        [result] = self.run_async(globber.glob('store/x.bin', with_stat=True))
+        assert result.is_file() and not result.is_symlink() and result.size == 3
+
+    def test_custom_predicate(self):
+        if not hasattr(glob2, 'AsyncGlobber'):
+            return
+        globber = self.storage_globber()
+        assert self.run_async(globber.glob(
+            'store/**', predicate=lambda r: r.is_dir())) == ['store/sub']
+        assert self.run_async(globber.glob(
+            'store/**', predicate=lambda r: r.size > 4)) == ['store/sub/y.bin']
+        assert self.run_async(globber.glob(
+            'store/**', min_size=4)) == ['store/sub/y.bin']
+
+    def test_sync_api(self):
+        if not hasattr(glob2, 'AsyncGlobber'):
+            return
+        try:
+            list(glob2.AsyncGlobber().iglob('*'))
+        except TypeError:
+            pass
+        else:
+            assert False
+
+
+class TestShardedGlobber(BaseTest):
+
+    def setup_files(self):
+        # Enough directories at the top for the search to be sharded.
+        for i in range(12):
+            self.makedirs('d%d' % i, 'd%d/sub' % i, 'd%d/sub/deeper' % i)
+            self.touch('d%d/a.py' % i, 'd%d/sub/b.py' % i,
+                       'd%d/sub/deeper/c.py' % i, 'd%d/sub/d.txt' % i)
+
+    def test(self):
+        globber = glob2.ShardedGlobber(processes=2, batch_size=2)
+        for pattern in ('**/*.py', 'd*/sub/*', '**/deeper/', 'd1/**'):
+            assert sorted(globber.glob(pattern, True)) == \
+                sorted(glob2.glob(pattern, True))
+
+    def test_many(self):
+        globber = glob2.ShardedGlobber(processes=2, batch_size=2)
+        assert sorted(globber.glob_many(['**/*.py', '**/*.txt'])) == \
+            sorted(glob2.glob_many(['**/*.py', '**/*.txt']))
+
+    def test_compiled(self):
+        globber = glob2.ShardedGlobber(processes=2, batch_size=2)
+        pattern = globber.compile('**/*.py', exclude=['deep*/'])
+        assert sorted(pattern.glob()) == sorted(
+            glob2.glob('**/*.py', exclude=['deep*/']))
+
+    def test_unpicklable_predicate(self):
+        globber = glob2.ShardedGlobber(processes=2, batch_size=2)
+        predicate = lambda result: 'sub' in result.path
+        assert sorted(globber.glob('**/*.py', predicate=predicate)) == sorted(
+            glob2.glob('**/*.py', predicate=predicate))
+
+    def test_mixin(self):
+        class StorageGlobber(glob2.Globber):
+            def __init__(self, storage):
+                self.storage = storage
+
+            def listdir(self, path):
+                return self.storage[path]
+
+        class ShardedStorageGlobber(glob2.ShardedGlobber, StorageGlobber):
+            pass
+
+        globber = ShardedStorageGlobber(storage={'.': ['a', 'b']}, processes=2)
+        assert sorted(globber.glob('*')) == ['a', 'b']
+        assert globber.processes == 2
+
+    def test_normalized(self):
+        # The normalization of the paths goes to the processes as well.
+        globber = glob2.ShardedGlobber(processes=2, batch_size=2)
+        found = sorted(globber.glob('*/*.py', norm_paths=None, sep=':'))
+        assert found == sorted(glob2.glob('*/*.py', norm_paths=None, sep=':'))
+        assert len(found) == 12
+
+
+class TestInstrumentedGlobber(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('dir', 'dir/sub')
+        self.touch('dir/a.py', 'dir/b.txt', 'dir/sub/c.py')
+
+    def test(self):
+        calls = []
+        directories = []
+        globber = glob2.InstrumentedGlobber(
+            on_call=lambda method, path, seconds: calls.append((method, path)),
+            on_directory=lambda path, *numbers: directories.append((path,) + numbers[1:]))
+        assert sorted(globber.glob('dir/**/*.py')) == ['dir/a.py', 'dir/sub/c.py']
+
+        stats = globber.stats
+        assert stats.calls['scandir'] == 2
+        assert ('scandir', 'dir') in calls
+        assert stats.times['scandir'] > 0
+        assert stats.directories == 3
+        assert stats.entries_listed == 4
+        assert stats.entries_matched == 2
+        # b.txt is the only entry neither matched nor searched.
+        assert stats.entries_rejected == 1
+        assert ('dir', 3, 1, 1) in directories
+        assert stats.pattern_cache_hits + stats.pattern_cache_misses > 0
+
+        assert globber.glob('dir/a.py') == ['dir/a.py']
+        assert stats.calls['exists'] == 1
+        stats.reset()
+        assert stats.as_dict()['directories'] == 0
+
+    def test_custom(self):
+        class CustomGlobber(glob2.Globber):
+            def listdir(self, path):
+                return os.listdir(path)
+
+        class InstrumentedCustomGlobber(glob2.InstrumentedGlobber, CustomGlobber):
+            pass
+
+        globber = InstrumentedCustomGlobber()
+        assert sorted(globber.glob('dir/*/')) == ['dir/sub/']
+        assert globber.stats.calls['scandir'] == 1
+        assert globber.stats.calls['listdir'] == 1
+
+    def test_native(self):
+        class InstrumentedCachingGlobber(glob2.InstrumentedGlobber,
+                                         glob2.CachingGlobber):
+            pass
+        assert InstrumentedCachingGlobber()._native_fs()
+
+
+class TestLimits(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a/b/c/d', 'e')
+        self.touch('x.lock', 'a/x.lock', 'a/b/x.lock', 'a/b/c/x.lock',
+                   'a/b/c/d/x.lock', 'e/x.lock')
+
+    def test_limit(self):
+        globber = glob2.InstrumentedGlobber()
+        assert len(globber.glob('**/*.lock', limit=1)) == 1
+        assert globber.stats.calls['scandir'] == 1
+        assert len(glob2.glob('**/*.lock', limit=3)) == 3
+        assert glob2.glob('**/*.lock', limit=0) == []
+        assert len(glob2.glob_many(['**/*.lock', '*/'], limit=2)) == 2
+
+    def test_depth(self):
+        globber = glob2.InstrumentedGlobber()
+        assert sorted(globber.glob('**/*.lock', max_depth=2)) == \
+            ['a/x.lock', 'e/x.lock', 'x.lock']
+        # Nothing below a/ and e/ needs to be read.
+        assert globber.stats.calls['scandir'] == 3
+        assert sorted(glob2.glob('**/*.lock', min_depth=4)) == \
+            ['a/b/c/d/x.lock', 'a/b/c/x.lock']
+        assert glob2.glob('**/*.lock', min_depth=3, max_depth=3) == \
+            ['a/b/x.lock']
+
+    def test_depth_base(self):
+        # Depths count from the directory the literal part names.
+        assert sorted(glob2.glob('a/b/**/*.lock', max_depth=1)) == \
+            ['a/b/x.lock']
+        assert glob2.glob('a/b/*/', max_depth=1) == ['a/b/c/']
+        assert sorted(glob2.glob('**/', max_depth=1)) == ['a/', 'e/']
+        assert glob2.glob('a/x.lock', max_depth=1) == ['a/x.lock']
+        assert glob2.glob('a/x.lock', min_depth=2) == []
+
+    def test_walk(self):
+        assert [top for top, _ in glob2.Globber().walk('a', max_depth=1)] == \
+            ['a', 'a/b']
+        assert [top for top, _ in glob2.Globber().walk('a', max_depth=0)] == \
+            ['a']
+
+
+class TestBraces(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('src/core/sub', 'src/plugins', 'src/docs', 'lib/a')
+        self.touch('src/core/a.py', 'src/core/sub/b.pyx', 'src/core/c.c',
+                   'src/plugins/d.pxd', 'src/docs/e.py', 'lib/a/f.py',
+                   'setup.py', 'setup.cfg', 'x{y}')
+
+    def test(self):
+        assert sorted(glob2.glob('src/{core,plugins,vendor}/**/*.{py,pyx,pxd}')) == [
+            'src/core/a.py', 'src/core/sub/b.pyx', 'src/plugins/d.pxd']
+        assert sorted(glob2.glob('setup.{py,cfg}')) == ['setup.cfg', 'setup.py']
+        assert glob2.glob('{src/core,lib/a}/*.py') == ['src/core/a.py', 'lib/a/f.py']
+        # Not a list of alternatives.
+        assert glob2.glob('x{y}') == ['x{y}']
+
+    def test_with_matches(self):
+        assert sorted(glob2.glob('src/{core,plugins}/*.{py,pxd}', True)) == [
+            ('src/core/a.py', ('core', 'a', 'py')),
+            ('src/plugins/d.pxd', ('plugins', 'd', 'pxd'))]
+
+    def test_single_pass(self):
+        globber = glob2.InstrumentedGlobber()
+        globber.glob('src/{core,docs,vendor}/**/*.{py,pyx}')
+        # src itself is not listed; core, core/sub, docs and the missing
+        # vendor are, once each.
+        assert globber.stats.calls['scandir'] == 4
+
+    def test_fnmatch(self):
+        assert fnmatch.filter(['a.py', 'b.pyx', 'c.c'], '*.{py,pyx}') == [
+            ('a.py', ('a', 'py')), ('b.pyx', ('b', 'pyx'))]
+        # A brace is a single group, whatever it contains.
+        assert fnmatch.filter(['ab', 'acd', 'a'], 'a{b,c{d,e}}') == [
+            ('ab', ('b',)), ('acd', ('cd',))]
+        assert fnmatch.filter(['a.py', 'b.px1'], '*.{py,px*}') == [
+            ('a.py', ('a', 'py')), ('b.px1', ('b', 'px1'))]
+
+
+class TestWithStat(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('dir/sub')
+        with open(path.join(self.basedir, 'dir/data.bin'), 'wb') as f:
+            f.write(b'x' * 100)
+        self.touch('dir/sub/empty.txt')
+
+    def test(self):
+        results = sorted(glob2.glob('dir/**', with_stat=True),
+                         key=lambda r: r.path)
+        assert [r.path for r in results] == [
+            'dir/data.bin', 'dir/sub', 'dir/sub/empty.txt']
+        data, sub, empty = results
+        assert data.groups == ('data.bin',)
+        assert data.is_file() and not data.is_dir() and not data.is_symlink()
+        assert sub.is_dir() and not sub.is_file()
+        assert data.size == 100 and empty.size == 0
+        assert data.mtime == os.stat('dir/data.bin').st_mtime
+
+    def test_not_listed(self):
+        # Neither is found in a listing; the type is looked up on demand.
+        result, = glob2.glob('dir/data.bin', with_stat=True)
+        assert result.groups == () and result.is_file() and result.size == 100
+        result, = glob2.glob('dir/*/', with_stat=True)
+        assert result.path == 'dir/sub/' and result.is_dir()
+
+    def test_custom_globber(self):
+        class ListdirGlobber(glob2.Globber):
+            listdir = staticmethod(os.listdir)
+        result, = ListdirGlobber().glob('dir/*.bin', with_stat=True)
+        assert result.is_file() and result.size == 100
+
+    def test_sharded(self):
+        globber = glob2.ShardedGlobber(processes=2)
+        result, = globber.glob('dir/**/*.bin', with_stat=True)
+        assert result.is_file() and result.size == 100
+
+
+class TestCriteria(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('dir/sub', 'dir/old')
+        for name, size in (('dir/big.bin', 2000), ('dir/small.bin', 10),
+                           ('dir/sub/mid.bin', 500)):
+            with open(path.join(self.basedir, name), 'wb') as f:
+                f.write(b'x' * size)
+        self.touch('dir/old/stale.bin')
+        os.utime('dir/old/stale.bin', (1000000000, 1000000000))
+        if hasattr(os, 'symlink'):
+            os.symlink('big.bin', 'dir/link.bin')
+
+    def test_type(self):
+        assert sorted(glob2.glob('dir/**', type='d')) == ['dir/old', 'dir/sub']
+        assert glob2.glob('dir/*/', type='d') != []
+        assert glob2.glob('dir/*/', type='f') == []
+        files = sorted(glob2.glob('dir/**/*.bin', type='f'))
+        assert files == ['dir/big.bin', 'dir/old/stale.bin', 'dir/small.bin',
+                         'dir/sub/mid.bin']
+        if hasattr(os, 'symlink'):
+            assert glob2.glob('dir/*', type='l') == ['dir/link.bin']
+            # Also where the type is not known from a listing.
+            assert glob2.glob('dir/link.bin', type='l') == ['dir/link.bin']
+            assert glob2.glob('dir/link.bin', type='f') == []
+
+    def test_size_and_time(self):
+        assert sorted(glob2.glob('dir/**/*.bin', type='f', min_size=500)) == [
+            'dir/big.bin', 'dir/sub/mid.bin']
+        assert glob2.glob('dir/**/*.bin', type='f', max_size=0) == [
+            'dir/old/stale.bin']
+        assert glob2.glob('dir/**/*.bin', older_than=1500000000) == [
+            'dir/old/stale.bin']
+        assert 'dir/old/stale.bin' not in glob2.glob(
+            'dir/**/*.bin', newer_than=1500000000)
+
+    def test_predicate(self):
+        assert glob2.glob('dir/**/*.bin', True, type='f',
+                          predicate=lambda r: r.groups[0] == 'sub') == [
+            ('dir/sub/mid.bin', ('sub', 'mid'))]
+
+    def test_custom_globber(self):
+        class ListdirGlobber(glob2.Globber):
+            listdir = staticmethod(os.listdir)
+        globber = ListdirGlobber()
+        assert sorted(globber.glob('dir/*', type='d')) == ['dir/old', 'dir/sub']
+        assert globber.glob('dir/*.bin', min_size=1000, type='f') == [
+            'dir/big.bin']
+
+    def test_invalid(self):
+        try:
+            glob2.glob('*', type='x')
+        except ValueError:
+            pass
+        else:
+            assert False
+
+
+class TestSort(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a/b', 'a-b/c', 'a.d', 'b/a', 'B')
+        self.touch('a/x.py', 'a/b/y.py', 'a/b.py', 'a-b/c/z.py', 'a-b.py',
+                   'a.d/w.py', 'b/a/v.py', 'B/u.py', 'a.py')
+
+    def test(self):
+        for pattern in ('**/*.py', '**', '*/*.py', '**/', '{a,b}/**/*.py'):
+            result = glob2.glob(pattern, sort=True)
+            assert result == sorted(glob2.glob(pattern)), pattern
+        assert glob2.glob('**/*.py', True, sort=True) == \
+            sorted(glob2.glob('**/*.py', True))
+        assert [path for path, _ in glob2.glob_many(
+            ['**/*.py', 'a*/'], sort=True)] == \
+            sorted(glob2.glob('**/*.py') + glob2.glob('a*/'))
+
+    def test_lazy(self):
+        globber = glob2.InstrumentedGlobber()
+        results = globber.iglob('**/*.py', sort=True)
+        assert next(results) == 'B/u.py'
+        # The root, and B; nothing else can hold an earlier match.
+        assert globber.stats.calls['scandir'] == 2
+
+    def test_parallel(self):
+        expected = sorted(glob2.glob('**'))
+        assert glob2.ParallelGlobber(workers=4).glob('**', sort=True) == expected
+        assert glob2.ShardedGlobber(processes=2).glob('**', sort=True) == expected
+
+    def test_async(self):
+        if not hasattr(glob2, 'AsyncGlobber'):
+            return
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(
+                glob2.AsyncGlobber(concurrency=2).glob('**', sort=True))
+        finally:
+            loop.close()
+        assert result == sorted(glob2.glob('**'))
+
+
+class TestFollowLinks(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a/b', 'c')
+        self.touch('a/b/x.py', 'c/y.py')
+        if hasattr(os, 'symlink'):
+            os.symlink(path.join('..', 'c'), 'a/to_c')
+            # Loops: back to a directory the search is in.
+            os.symlink(path.join('..', '..', 'a'), 'a/b/loop')
+            os.symlink(path.join('..', 'a'), 'c/to_a')
+
+    def test_glob(self):
+        if not hasattr(os, 'symlink'):
+            return
+        # '**' stops at links, but the rest of the pattern applies to
+        # what they point to.
+        assert sorted(glob2.glob('a/**/*.py')) == ['a/b/x.py', 'a/to_c/y.py']
+        assert sorted(glob2.glob('a/**')) == [
+            'a/b', 'a/b/loop', 'a/b/x.py', 'a/to_c']
+        # Followed, but not back into a directory the search is in.
+        assert sorted(glob2.glob('a/**', followlinks=True)) == [
+            'a/b', 'a/b/loop', 'a/b/x.py', 'a/to_c', 'a/to_c/to_a',
+            'a/to_c/y.py']
+        assert sorted(glob2.glob('c/**/x.py', followlinks=True)) == [
+            'c/to_a/b/x.py']
+
+    def test_walk(self):
+        if not hasattr(os, 'symlink'):
+            return
+        walked = [top for top, _ in glob2.Globber().walk('a', followlinks=True)]
+        assert walked == ['a', 'a/b', 'a/to_c']
+        walked = [top for top, _ in glob2.Globber().walk('a')]
+        assert walked == ['a', 'a/b']
+
+    def test_deep(self):
+        import inspect
+        import sys
+        for _ in range(200):
+            os.mkdir('d')
+            os.chdir('d')
+        os.chdir(self.basedir)
+        # Deeper than the recursion limit allows to recurse.
+        old_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(len(inspect.stack()) + 50)
+        try:
+            walked = len(list(glob2.Globber().walk('d')))
+            found = len(glob2.glob('d/**/'))
+        finally:
+            sys.setrecursionlimit(old_limit)
+        assert walked == found == 200
+
+    def test_one_filesystem(self):
+        # No other filesystem to cross here; just the same results.
+        assert sorted(glob2.glob('**/*.py', one_filesystem=True)) == \
+            sorted(glob2.glob('**/*.py'))
+
+
+class TestRepeatedGlobstars(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a/b/c/b/d', 'a/.h/b', 'a/b/b/.h')
+        self.touch('a/b/c/b/d/x.c', 'a/b/x.c', 'a/.h/b/y.c', 'a/b/b/.h/z.c', 'x')
+
+    def test_no_duplicates(self):
+        assert glob2.glob('**/**/x', True) == [('x', ('', ''))]
+        assert sorted(glob2.glob('a/**/b/**/*.c')) == [
+            'a/b/b/.h/z.c', 'a/b/c/b/d/x.c', 'a/b/x.c']
+        assert glob2.glob('a/**/**/d/', True) == [('a/b/c/b/d/', ('b/c/b', ''))]
+        # The second '**' reaches a/b/c/b/ having matched c/b, and
+        # starting afresh after the b/ in it.
+        found = glob2.glob('**/b/**')
+        assert len(found) == len(set(found))
+        assert 'a/b/c/b/d/x.c' in found
+        assert glob2.glob('**/b/**/x.c', True) == [
+            ('a/b/x.c', ('a', '')), ('a/b/c/b/d/x.c', ('a', 'c/b/d'))]
+
+    def test_hidden(self):
+        # Like a single '**', two in a row skip hidden names only where
+        # they start.
+        assert glob2.glob('a/**/**/y.c') == []
+        assert glob2.glob('a/**/**/y.c', include_hidden=True) == ['a/.h/b/y.c']
+        # Here, the second '**' reaches a/b/b/.h/ both from a/b/ (having
+        # matched b/ when it gets there) and from a/b/b/ (skipping it).
+        assert 'a/b/b/.h/z.c' in glob2.glob('a/**/b/**/*.c')
+
+    def test_single_pass(self):
+        globber = glob2.InstrumentedGlobber()
+        globber.glob('**/**/**/*.c', include_hidden=True)
+        assert globber.stats.calls['scandir'] == 10
+
+
+class TestCompile(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('src/pkg', 'src/.hidden', 'other/pkg')
+        self.touch('src/a.py', 'src/pkg/b.py', 'src/.hidden/c.py',
+                   'other/pkg/d.py', 'other/e.txt')
+
+    def test_iglob(self):
+        pattern = glob2.compile('pkg/*.py')
+        assert pattern.glob() == []
+        assert pattern.glob('src') == [os.path.join('src', 'pkg', 'b.py')]
+        assert pattern.glob('other', with_matches=True) == [
+            (os.path.join('other', 'pkg', 'd.py'), ('d',))]
+        assert len(glob2.compile('**/*.py').glob(limit=2)) == 2
+
+    def test_match(self):
+        pattern = glob2.compile('src/**/*.py')
+        assert pattern.match('src/pkg/b.py') == ('pkg', 'b')
+        assert pattern.match('src/a.py') == ('', 'a')
+        assert pattern.match('src/.hidden/c.py') is None
+        assert pattern.match('other/pkg/d.py') is None
+        assert glob2.compile('src/**/', max_depth=1).match('src/pkg/') == ('pkg',)
+        assert glob2.compile('src/**/', max_depth=1).match('src/pkg/x/') is None
+        assert glob2.compile('*.{py,txt}').match('a.txt') == ('a', 'txt')
+
+    def test_exclude(self):
+        pattern = glob2.compile('**/*.py', exclude=['pkg/'])
+        assert pattern.match('src/a.py') == ('src', 'a')
+        assert pattern.match('src/pkg/b.py') is None
+        assert os.path.join('src', 'pkg', 'b.py') not in pattern.glob()
+
+    def test_filter(self):
+        pattern = glob2.compile('**/*.py')
+        paths = ['src/a.py', 'other/e.txt', 'x/y/z.py', '.git/h.py']
+        assert pattern.filter(paths) == ['src/a.py', 'x/y/z.py']
+        assert pattern.filter(paths, with_matches=True) == [
+            ('src/a.py', ('src', 'a')), ('x/y/z.py', ('x/y', 'z'))]
+
+    def test_whole_path_regex(self):
+        # Matching a path with one regular expression must come to the
+        # same as running the pattern segment by segment.
+        paths = ['a', 'a/', 'a/b', 'a//b', '.a/b', 'a/.b', 'a/b/.c/d.py',
+                 'x/a/b.py', 'a/b/c/', 'a/b/c/d', '/a/b', 'a/b/', 'b/\n.py']
+        for p in ('a/*', '**/b', '**/*.py', 'a/**', '**/', 'a/**/', '*/{b,.c}',
+                  '*/[!a]', 'a/?', '/a/*', '**/{*.py,c}', 'a/**/**/d'):
+            for include_hidden in (False, True):
+                program = glob2.compile(p, include_hidden=include_hidden)._program
+                assert program._whole is not None
+                stepwise = copy.copy(program)
+                stepwise._whole = None
+                for name in paths:
+                    assert program.match(name) == stepwise.match(name), (p, name)
+                assert glob2.compile(p, include_hidden=include_hidden).filter(
+                    paths) == [name for name in paths if stepwise.match(name)]
+        # Not with several '**' or exclude rules, though.
+        assert glob2.compile('**/a/**')._program._whole is None
+        assert glob2.compile('**/*.py', exclude='a')._program._whole is None
+
+    def test_agrees_with_glob(self):
+        for p in ('**/*.py', '*/pkg/*', 'src/**', '**/', '*/*.{py,txt}'):
+            pattern = glob2.compile(p)
+            found = glob2.glob(p, with_matches=True)
+            assert sorted(found) == sorted(pattern.glob(with_matches=True))
+            for path, groups in found:
+                assert pattern.match(path.replace(os.sep, '/')) == groups
+
+
+class TestIndexedGlobber(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('a/b/c', 'a/.h', 'a/empty', 'ab')
+        self.touch('a/x.py', 'a/b/y.py', 'a/b/c/z.py', 'a/.h/w.py',
+                   'a/b.txt', 'ab/v.py', 'top.py')
+        self.paths = ['./a/x.py', 'a/b/y.py', 'a/b/c/z.py', 'a/.h/w.py',
+                      'a/b.txt', 'a/empty/', 'ab/v.py', 'top.py']
+
+    def test_agrees_with_filesystem(self):
+        globber = glob2.IndexedGlobber(self.paths)
+        for pattern in ('**/*.py', 'a/*', 'a/**/', '*/*.py', 'a/b', 'a/b/',
+                        'a/x.py/', 'a/{b,empty}/*', '**/c/', 'nope/*', ''):
+            for options in ({}, {'include_hidden': True}):
+                assert (sorted(globber.glob(pattern, True, **options)) ==
+                        sorted(glob2.glob(pattern, True, **options))), pattern
+
+    def test_methods(self):
+        globber = glob2.IndexedGlobber(self.paths)
+        assert sorted(globber.listdir('a')) == ['.h', 'b', 'b.txt', 'empty', 'x.py']
+        assert globber.listdir('a/empty') == []
+        assert globber.exists('a/b') and globber.isdir('a/b')
+        assert globber.exists('a/b.txt') and not globber.isdir('a/b.txt')
+        assert not globber.exists('a/b.t') and not globber.exists('a/x.py/')
+        for path in ('a/x.py', 'nope'):
+            try:
+                globber.listdir(path)
+            except OSError:
+                pass
+            else:
+                assert False
+
+    def test_with_stat(self):
+        globber = glob2.IndexedGlobber(self.paths)
+        result, = globber.glob('a/b.t*', with_stat=True)
+        assert result.is_file() and not result.is_dir()
+        assert not result.is_symlink()
+
+    def test_absolute(self):
+        globber = glob2.IndexedGlobber(['/usr/lib/x.so', '/usr/bin/y', '/etc/z'])
+        assert globber.glob('/usr/**/*.so') == ['/usr/lib/x.so']
+        assert sorted(globber.glob('/*/')) == ['/etc/', '/usr/']
+
+    def test_bytes(self):
+        globber = glob2.IndexedGlobber([b'a/x.py', b'a/b/y.py'])
+        assert sorted(globber.glob(b'a/**/*.py')) == [b'a/b/y.py', b'a/x.py']
+
+
+class TestArchiveGlobbers(BaseTest):
+
+    def setup_files(self):
+        import tarfile
+        import zipfile
+        with zipfile.ZipFile('a.zip', 'w') as archive:
+            archive.writestr('pkg/', '')
+            archive.writestr('pkg/mod.py', 'x = 1\n')
+            archive.writestr('pkg/_ext.so', 'x' * 100)
+            archive.writestr('pkg/sub/_sub.so', '')
+        self.makedirs('tree/lib/deep')
+        self.touch('tree/lib/a.so', 'tree/lib/deep/b.so', 'tree/README')
+        with open('tree/README', 'w') as f:
+            f.write('hello')
+        archive = tarfile.open('a.tar.gz', 'w:gz')
+        archive.add('tree', '.')
+        archive.close()
+
+    def test_zip(self):
+        with glob2.ZipGlobber('a.zip') as globber:
+            assert sorted(globber.glob('**/*.so', True)) == [
+                ('pkg/_ext.so', ('pkg', '_ext')),
+                ('pkg/sub/_sub.so', ('pkg/sub', '_sub'))]
+            assert sorted(globber.glob('pkg/*/')) == ['pkg/sub/']
+            assert globber.glob('**/*.so', min_size=1) == ['pkg/_ext.so']
+            assert sorted(globber.glob('pkg/*', type='d')) == ['pkg/sub']
+            with globber.open('pkg/mod.py') as f:
+                assert f.read() == b'x = 1\n'
+
+    def test_predicate(self):
+        with glob2.ZipGlobber('a.zip') as globber:
+            assert globber.glob('**/*.so', predicate=lambda r: r.size > 10) == [
+                'pkg/_ext.so']
+
+    def test_with_stat(self):
+        # Sizes and types come from the archive, not from local files of
+        # the same name.
+        self.makedirs('pkg')
+        self.touch('pkg/_ext.so')
+        with glob2.ZipGlobber('a.zip') as globber:
+            results = globber.glob('pkg/*', with_stat=True)
+            by_path = dict((result.path, result) for result in results)
+            assert by_path['pkg/_ext.so'].size == 100
+            assert by_path['pkg/_ext.so'].is_file()
+            assert by_path['pkg/sub'].is_dir()
+            assert not by_path['pkg/sub'].is_file()
+
+    def test_tar(self):
+        with glob2.TarGlobber('a.tar.gz') as globber:
+            assert sorted(globber.glob('**/*.so')) == ['lib/a.so', 'lib/deep/b.so']
+            assert globber.glob('*', type='f') == ['README']
+            assert globber.stat('README').st_size == 5
+            assert globber.glob('**/R*', newer_than=1) == ['README']
+            assert globber.open('README').read() == b'hello'
+
+
+class TestWatch(BaseTest):
+
+    def setup_files(self):
+        self.makedirs('static/css', 'other')
+        self.touch('static/css/a.css', 'static/x.js', 'other/y.js')
+
+    def read_until(self, watcher, count):
+        events = []
+        while len(events) < count:
+            found = watcher.read(5)
+            assert found, events
+            events.extend(found)
+        return [(e.kind, e.path, e.groups) for e in events]
+
+    def test(self):
+        if not sys.platform.startswith('linux'):
+            return
+        with glob2.watch('static/**/*.{css,js}') as watcher:
+            assert sorted(watcher.matches) == ['static/css/a.css', 'static/x.js']
+            # Only the directories which may hold matches are watched.
+            assert 'other' not in watcher._path_wd
+
+            self.makedirs('static/js/lib')
+            self.touch('static/js/lib/b.js')
+            assert self.read_until(watcher, 1) == [
+                ('added', 'static/js/lib/b.js', ('js/lib', 'b', 'js'))]
+
+            shutil.rmtree('static/css')
+            assert self.read_until(watcher, 1) == [
+                ('removed', 'static/css/a.css', ('css', 'a', 'css'))]
+
+            os.rename('static/js', 'static/js2')
+            assert sorted(self.read_until(watcher, 2)) == [
+                ('added', 'static/js2/lib/b.js', ('js2/lib', 'b', 'js')),
+                ('removed', 'static/js/lib/b.js', ('js/lib', 'b', 'js'))]
+
+            self.touch('other/z.js', 'static/.hidden.js')
+            assert watcher.read(0.2) == []
+            assert sorted(watcher.matches) == ['static/js2/lib/b.js', 'static/x.js']